@@ -3,6 +3,7 @@ Gmail Agent
 Handles email operations
 """
 from typing import Dict, Any, List
+import asyncio
 import base64
 import os
 from email.mime.text import MIMEText
@@ -113,10 +114,12 @@ class GmailAgent(BaseAgent):
             raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
 
             # Send email
-            sent_message = self.service.users().messages().send(
-                userId='me',
-                body={'raw': raw_message}
-            ).execute()
+            sent_message = await asyncio.to_thread(
+                self.service.users().messages().send(
+                    userId='me',
+                    body={'raw': raw_message}
+                ).execute
+            )
 
             self.log(f"Sent email to {to}")
 
@@ -188,10 +191,12 @@ class GmailAgent(BaseAgent):
             raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
 
             # Create draft
-            draft = self.service.users().drafts().create(
-                userId='me',
-                body={'message': {'raw': raw_message}}
-            ).execute()
+            draft = await asyncio.to_thread(
+                self.service.users().drafts().create(
+                    userId='me',
+                    body={'message': {'raw': raw_message}}
+                ).execute
+            )
 
             self.log(f"Created draft for {to}")
 
@@ -240,23 +245,27 @@ class GmailAgent(BaseAgent):
         """
         try:
             # Search for messages
-            results = self.service.users().messages().list(
-                userId='me',
-                q=query,
-                maxResults=max_results
-            ).execute()
+            results = await asyncio.to_thread(
+                self.service.users().messages().list(
+                    userId='me',
+                    q=query,
+                    maxResults=max_results
+                ).execute
+            )
 
             messages = results.get('messages', [])
 
             # Get full message details
             email_list = []
             for msg in messages:
-                msg_detail = self.service.users().messages().get(
-                    userId='me',
-                    id=msg['id'],
-                    format='metadata',
-                    metadataHeaders=['From', 'To', 'Subject', 'Date']
-                ).execute()
+                msg_detail = await asyncio.to_thread(
+                    self.service.users().messages().get(
+                        userId='me',
+                        id=msg['id'],
+                        format='metadata',
+                        metadataHeaders=['From', 'To', 'Subject', 'Date']
+                    ).execute
+                )
 
                 headers = {h['name']: h['value'] for h in msg_detail.get('payload', {}).get('headers', [])}
 
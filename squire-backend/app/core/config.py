@@ -38,6 +38,8 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
     REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    # Base64 (urlsafe) 256-bit AES key for OAuth tokens at rest; tokens are stored unencrypted if unset
+    TOKEN_ENCRYPTION_KEY: str = ""
 
     # Security settings
     ALLOWED_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:5173", "http://localhost:8000"]
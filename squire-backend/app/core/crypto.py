@@ -0,0 +1,53 @@
+"""
+Encryption for secrets stored in the database
+"""
+import base64
+import os
+from functools import lru_cache
+from typing import Optional
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from app.core.config import settings
+
+# Marks encrypted values so rows written before encryption was enabled still read back
+ENCRYPTED_PREFIX = "enc:v1:"
+NONCE_SIZE = 12
+
+
+@lru_cache(maxsize=1)
+def _get_cipher() -> Optional[AESGCM]:
+    """Build the AES-GCM cipher once from TOKEN_ENCRYPTION_KEY, or None if unset"""
+    if not settings.TOKEN_ENCRYPTION_KEY:
+        return None
+    return AESGCM(base64.urlsafe_b64decode(settings.TOKEN_ENCRYPTION_KEY))
+
+
+def encrypt_bytes(data: bytes) -> bytes:
+    """Encrypt with AES-GCM, returning a random 96-bit nonce followed by the ciphertext"""
+    cipher = _get_cipher()
+    if cipher is None:
+        raise ValueError("TOKEN_ENCRYPTION_KEY is not configured")
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + cipher.encrypt(nonce, data, None)
+
+
+def decrypt_bytes(data: bytes) -> bytes:
+    """Decrypt a value produced by encrypt_bytes"""
+    cipher = _get_cipher()
+    if cipher is None:
+        raise ValueError("TOKEN_ENCRYPTION_KEY is not configured")
+    return cipher.decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], None)
+
+
+def encrypt_token(token: Optional[str]) -> Optional[str]:
+    """Encrypt a token for storage; stored as-is when no key is configured"""
+    if not token or _get_cipher() is None:
+        return token
+    return ENCRYPTED_PREFIX + base64.b64encode(encrypt_bytes(token.encode())).decode()
+
+
+def decrypt_token(value: Optional[str]) -> Optional[str]:
+    """Decrypt a stored token, passing through values that were stored unencrypted"""
+    if not value or not value.startswith(ENCRYPTED_PREFIX):
+        return value
+    return decrypt_bytes(base64.b64decode(value[len(ENCRYPTED_PREFIX):])).decode()
@@ -1,21 +1,96 @@
 """
 Database connection and utilities
 """
-from supabase import create_client, Client
+import asyncio
+from typing import Optional
+
+import httpx
+import orjson
+from supabase import create_client, acreate_client, Client, ClientOptions, AsyncClient, AsyncClientOptions
 from app.core.config import settings
 
-# Initialize Supabase client
+# Initialize Supabase client on one persistent connection pool, shared by its
+# postgrest, auth and storage clients and kept across postgrest re-creation
 supabase: Client = create_client(
     settings.SUPABASE_URL,
-    settings.SUPABASE_KEY
+    settings.SUPABASE_KEY,
+    options=ClientOptions(
+        httpx_client=httpx.Client(
+            http2=True,
+            timeout=120.0,
+            limits=httpx.Limits(max_keepalive_connections=10)
+        )
+    )
 )
 
 
+class _OrjsonAsyncClient(httpx.AsyncClient):
+    """httpx client that serializes JSON request bodies with orjson"""
+
+    def build_request(self, method, url, *, json=None, content=None, headers=None, **kwargs):
+        if json is not None and content is None:
+            content = orjson.dumps(json, option=orjson.OPT_NON_STR_KEYS)
+            headers = httpx.Headers(headers)
+            headers.setdefault("Content-Type", "application/json")
+        return super().build_request(method, url, content=content, headers=headers, **kwargs)
+
+
+# Pooled HTTP/2 connections to Supabase, shared by every async client below
+_supabase_http_client = _OrjsonAsyncClient(
+    http2=True,
+    timeout=30.0,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+)
+
+# Async Supabase clients, created lazily on the running event loop.
+# The auth client is kept separate so sessions from sign-ins never
+# change the credentials used for database calls.
+_async_supabase: Optional[AsyncClient] = None
+_async_auth_client: Optional[AsyncClient] = None
+_async_supabase_lock = asyncio.Lock()
+
+
 async def get_supabase() -> Client:
     """Dependency to get Supabase client"""
     return supabase
 
 
+async def _create_async_client() -> AsyncClient:
+    return await acreate_client(
+        settings.SUPABASE_URL,
+        settings.SUPABASE_KEY,
+        options=AsyncClientOptions(httpx_client=_supabase_http_client)
+    )
+
+
+async def get_async_supabase() -> AsyncClient:
+    """Get the shared async Supabase client, creating it on first use"""
+    global _async_supabase
+    if _async_supabase is None:
+        async with _async_supabase_lock:
+            if _async_supabase is None:
+                _async_supabase = await _create_async_client()
+    return _async_supabase
+
+
+async def get_async_auth_client() -> AsyncClient:
+    """Get the async Supabase client used for auth calls, creating it on first use"""
+    global _async_auth_client
+    if _async_auth_client is None:
+        async with _async_supabase_lock:
+            if _async_auth_client is None:
+                _async_auth_client = await _create_async_client()
+    return _async_auth_client
+
+
+async def close_async_supabase() -> None:
+    """Close the async Supabase clients and their pooled connections"""
+    global _async_supabase, _async_auth_client
+    _async_supabase = None
+    _async_auth_client = None
+    await _supabase_http_client.aclose()
+
+
 class DatabaseError(Exception):
     """Custom database error"""
     pass
@@ -28,7 +103,10 @@ async def execute_query(table: str, operation: str, **kwargs):
 
         # Build query based on kwargs
         if operation == "select":
+            # Accept a column list as well as a PostgREST select string
             columns = kwargs.get("columns", "*")
+            if not isinstance(columns, str):
+                columns = ",".join(columns)
             query = query(columns)
         elif operation == "insert":
             query = query(kwargs.get("data", {}))
@@ -64,4 +142,21 @@ async def execute_query(table: str, operation: str, **kwargs):
 
         return response.data
     except Exception as e:
-        raise DatabaseError(f"Database error in {table}.{operation}: {str(e)}")
\ No newline at end of file
+        raise DatabaseError(f"Database error in {table}.{operation}: {str(e)}")
+
+
+async def execute_rpc(function: str, params: Optional[dict] = None):
+    """
+    Call a Postgres function through the async Supabase client with error handling
+
+    Hot paths go through PL/pgSQL functions rather than ad-hoc SQL: the
+    server caches each function's statement plans per connection, so no
+    client-side prepared statements are needed (which Supavisor's
+    transaction pooling would not support anyway).
+    """
+    try:
+        client = await get_async_supabase()
+        response = await client.rpc(function, params or {}).execute()
+        return response.data
+    except Exception as e:
+        raise DatabaseError(f"Database error in rpc {function}: {str(e)}")
@@ -0,0 +1,16 @@
+"""
+Shared HTTP client for outbound calls to third-party APIs
+"""
+import httpx
+
+# One connection pool for Google OAuth, JWKS fetches and other external APIs
+http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=30.0,
+    limits=httpx.Limits(max_keepalive_connections=50, max_connections=200)
+)
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client and its pooled connections"""
+    await http_client.aclose()
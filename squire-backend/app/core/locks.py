@@ -0,0 +1,34 @@
+"""
+Per-key asyncio locks that don't outlive their users
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Hashable, List
+
+
+class KeyedLocks:
+    """
+    One asyncio.Lock per key, created on first use and dropped once no task
+    holds or awaits it, so keys seen once don't stay in memory
+    """
+
+    def __init__(self):
+        # key -> [lock, tasks holding or awaiting it]
+        self._locks: Dict[Hashable, List] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
@@ -23,13 +23,14 @@ class JWTBearer(HTTPBearer):
                     detail="Invalid authentication scheme."
                 )
             token = credentials.credentials
-            if not await self.verify_jwt(token):
+            claims = await auth_service.verify_token(token)
+            if claims is None:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="Invalid token or expired token."
                 )
             # Store user info in request state for use in routes
-            user = await auth_service.get_user(token)
+            user = await auth_service.get_user(token, claims=claims)
             if not user:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
@@ -37,6 +38,7 @@ class JWTBearer(HTTPBearer):
                 )
             request.state.user = user
             request.state.user_id = user["id"]
+            request.state.user_claims = claims
             request.state.token = token
             return token
         else:
@@ -45,19 +47,6 @@ class JWTBearer(HTTPBearer):
                 detail="Invalid authorization code."
             )
 
-    async def verify_jwt(self, token: str) -> bool:
-        """
-        Verify if the JWT token is valid
-
-        Args:
-            token: JWT token string
-
-        Returns:
-            True if valid, False otherwise
-        """
-        payload = await auth_service.verify_token(token)
-        return payload is not None
-
 
 class OptionalJWTBearer(JWTBearer):
     """
@@ -72,12 +61,14 @@ class OptionalJWTBearer(JWTBearer):
             credentials: HTTPAuthorizationCredentials = await super(HTTPBearer, self).__call__(request)
             if credentials and credentials.scheme == "Bearer":
                 token = credentials.credentials
-                if await self.verify_jwt(token):
+                claims = await auth_service.verify_token(token)
+                if claims is not None:
                     # Store user info in request state
-                    user = await auth_service.get_user(token)
+                    user = await auth_service.get_user(token, claims=claims)
                     if user:
                         request.state.user = user
                         request.state.user_id = user["id"]
+                        request.state.user_claims = claims
                         request.state.token = token
                     return token
         except Exception:
@@ -86,6 +77,7 @@ class OptionalJWTBearer(JWTBearer):
         # No token or invalid token - set user as None
         request.state.user = None
         request.state.user_id = None
+        request.state.user_claims = None
         request.state.token = None
         return None
 
@@ -4,12 +4,14 @@ Authentication API endpoints
 from fastapi import APIRouter, HTTPException, status, Request, Depends
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, EmailStr, Field
+from postgrest import ReturnMethod
 from typing import Optional, Dict, Any
-from app.services.auth_service import auth_service
+from app.services.auth_service import auth_service, utc_timestamp
 from app.services.google_oauth import google_oauth_service
 from app.middleware.auth import jwt_bearer, get_current_user
-from app.core.database import supabase
-from datetime import datetime
+from app.core.database import get_async_supabase
+from app.core.crypto import encrypt_token
+import time
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
@@ -341,24 +343,27 @@ async def google_oauth_callback(code: str, state: str = None):
         print(f"✅ [Google OAuth] Got tokens (expires in {expires_in}s)")
 
         # Calculate expiry time
-        expires_at_timestamp = datetime.utcnow().timestamp() + expires_in
-        expires_at = datetime.fromtimestamp(expires_at_timestamp).isoformat()
+        now = time.time()
+        now_iso = utc_timestamp(now)
+        expires_at = utc_timestamp(now + expires_in)
 
         # Store Google OAuth tokens for the user
         token_data = {
             "user_id": state,  # User ID from state parameter
             "provider": "google",
-            "access_token": google_access_token,
-            "refresh_token": google_refresh_token,
+            "access_token": encrypt_token(google_access_token),
+            "refresh_token": encrypt_token(google_refresh_token),
             "expires_at": expires_at,
             "scopes": google_oauth_service.SCOPES,
-            "created_at": datetime.utcnow().isoformat(),
-            "updated_at": datetime.utcnow().isoformat()
+            "created_at": now_iso,
+            "updated_at": now_iso
         }
 
-        supabase.table("user_oauth_tokens").upsert(
+        supabase = await get_async_supabase()
+        await supabase.table("user_oauth_tokens").upsert(
             token_data,
-            on_conflict="user_id,provider"
+            on_conflict="user_id,provider",
+            returning=ReturnMethod.minimal
         ).execute()
 
         print(f"✅ [Google OAuth] Stored tokens with scopes: {google_oauth_service.SCOPES}")
@@ -391,7 +396,8 @@ async def check_google_connection(current_user: Dict = Depends(get_current_user)
         user_id = current_user["id"]
 
         # Check if user has Google OAuth tokens
-        result = supabase.table("user_oauth_tokens")\
+        supabase = await get_async_supabase()
+        result = await supabase.table("user_oauth_tokens")\
             .select("scopes, expires_at, created_at")\
             .eq("user_id", user_id)\
             .eq("provider", "google")\
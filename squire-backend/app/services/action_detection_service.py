@@ -7,6 +7,14 @@ import re
 from datetime import datetime, timedelta
 import dateparser
 
+# Relative date words recognised before falling back to dateparser
+_DATE_TOKEN_RE = re.compile(r"\b(tomorrow|next\s+week|today)\b")
+_DATE_TOKEN_OFFSETS = {
+    "tomorrow": timedelta(days=1),
+    "next week": timedelta(weeks=1),
+    "today": timedelta(0),
+}
+
 
 class ActionDetectionService:
     """
@@ -238,13 +246,11 @@ class ActionDetectionService:
     def _extract_date(self, text: str) -> Optional[datetime]:
         """Extract date mentions like 'tomorrow', 'next week', etc."""
         try:
-            # Common date patterns
-            if "tomorrow" in text:
-                return datetime.now() + timedelta(days=1)
-            elif "next week" in text:
-                return datetime.now() + timedelta(weeks=1)
-            elif "today" in text:
-                return datetime.now()
+            # Common date patterns, matched in a single scan
+            match = _DATE_TOKEN_RE.search(text)
+            if match:
+                token = " ".join(match.group(1).split())
+                return datetime.now() + _DATE_TOKEN_OFFSETS[token]
 
             # Try to parse with dateparser
             parsed = dateparser.parse(text, settings={'PREFER_DATES_FROM': 'future'})
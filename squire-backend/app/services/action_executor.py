@@ -2,11 +2,23 @@
 Action Executor Service
 Handles execution of actions from the action queue
 """
-from typing import Dict, Any, Optional, List
-from uuid import UUID
-from datetime import datetime
-
-from app.core.database import supabase
+import asyncio
+import logging
+import re
+import sys
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import cache
+from types import MappingProxyType
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
+from datetime import datetime, timezone
+
+from app.core.database import get_async_supabase
+from app.core.crypto import encrypt_token, decrypt_token
+from app.core.locks import KeyedLocks
+from app.services.google_oauth import google_oauth_service
+from app.services.auth_service import utc_timestamp
 from app.agents.base_agent import BaseAgent, ActionResult, AgentError
 from app.agents.gsuite.gmail_agent import GmailAgent
 import app.tools  # ensure registry is populated
@@ -18,6 +30,26 @@ except ImportError:
     # Fallback to original if optimized doesn't exist
     from app.agents.gsuite.calendar_agent import CalendarAgent
 
+logger = logging.getLogger(__name__)
+
+# Canonical 8-4-4-4-12 hex UUID
+_UUID_RE = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+
+# Map service names to provider names in user_oauth_tokens table
+_PROVIDER_MAP = MappingProxyType({
+    "gmail": "google",
+    "calendar": "google",
+    "drive": "google",
+    "notion": "notion",
+    "slack": "slack"
+})
+
+
+@cache
+def _action_metadata() -> Dict[str, Dict]:
+    """Tool metadata is static once app.tools has registered, so build it once"""
+    return as_action_metadata()
+
 
 class ActionExecutor:
     """
@@ -25,8 +57,23 @@ class ActionExecutor:
     Routes actions to appropriate agents and manages execution flow
     """
 
+    # Upper bound on one request's action steps executing at once
+    MAX_CONCURRENT_STEPS = 8
+
+    # Cached credentials are dropped this many seconds before the token expires
+    CREDENTIAL_EXPIRY_MARGIN = 60
+    # Cache lifetime for tokens stored without an expiry
+    DEFAULT_CREDENTIAL_TTL = 3600
+    # Least recently used credentials are dropped beyond this many (user, provider) pairs
+    CREDENTIAL_CACHE_MAX_SIZE = 1024
+    # Agents hold a Google API client each; least recently used ones are dropped beyond this
+    AGENT_CACHE_MAX_SIZE = 256
+
+    # Substrings of agent errors that mean the OAuth token was rejected
+    AUTH_FAILURE_MARKERS = ("401", "invalid_grant", "Invalid Credentials", "unauthorized")
+
     def __init__(self):
-        self.agent_registry: Dict[str, type] = {
+        agent_registry: Dict[str, type] = {
             # Gmail actions
             "gmail_send": GmailAgent,
             "gmail_create_draft": GmailAgent,
@@ -44,6 +91,22 @@ class ActionExecutor:
             "calendar_set_reminders": CalendarAgent,
             "calendar_add_attendees": CalendarAgent,
         }
+        # Intern keys so lookups with interned action types hit on identity
+        self.agent_registry: Dict[str, type] = {
+            sys.intern(action_type): agent_class
+            for action_type, agent_class in agent_registry.items()
+        }
+
+        # (user_id, provider) -> (credentials, monotonic expiry)
+        self._cred_cache: "OrderedDict[Tuple[str, str], Tuple[Dict[str, Any], float]]" = OrderedDict()
+        # Per-key locks so concurrent misses share a single lookup/refresh
+        self._cred_locks = KeyedLocks()
+        # (user_id, service_name) -> (agent, access token it was built with, monotonic expiry)
+        self._agent_cache: "OrderedDict[Tuple[str, str], Tuple[BaseAgent, str, float]]" = OrderedDict()
+        # (user_id, service_name) -> lock held while a step drives that Google
+        # service; its httplib2 transport isn't thread-safe, so concurrent steps
+        # for the same user and service take turns
+        self._service_locks = KeyedLocks()
 
     async def execute_direct_actions(
         self,
@@ -62,11 +125,27 @@ class ActionExecutor:
         Returns:
             List of ActionResult objects
         """
-        results = []
-
-        metadata = as_action_metadata()
-
-        for step in action_steps:
+        metadata = _action_metadata()
+
+        # Steps are independent, so run them concurrently (steps on the same
+        # service take turns in _execute_action); gather keeps results in step order
+        # The cap is per request, so one request's queued steps never hold up another's
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_STEPS)
+        return await asyncio.gather(*[
+            self._run_step(step, user_id, suggestion_id, metadata, semaphore)
+            for step in action_steps
+        ])
+
+    async def _run_step(
+        self,
+        step: Dict[str, Any],
+        user_id: str,
+        suggestion_id: Optional[str],
+        metadata: Dict[str, Any],
+        semaphore: asyncio.Semaphore
+    ) -> ActionResult:
+        """Validate, queue and execute a single action step"""
+        async with semaphore:
             try:
                 action_type = step.get("action_type")
                 action_params = step.get("action_params", {})
@@ -83,8 +162,9 @@ class ActionExecutor:
                             f"Missing required parameters for {action_type}: {missing}"
                         )
 
-                # Queue the action
-                action_id = await self._queue_action(
+                # Queue the action (auto-approving if required) and get its row back
+                # In production, approval would wait via WebSocket/polling
+                action_data = await self._queue_action_step(
                     user_id=user_id,
                     suggestion_id=suggestion_id,
                     action_type=action_type,
@@ -93,27 +173,21 @@ class ActionExecutor:
                     priority=step.get("priority", 5)
                 )
 
-                # If requires approval, wait for it
-                if step.get("requires_approval", True):
-                    print(f"⏳ Action {action_id} requires approval, waiting...")
-                    # In production, this would wait via WebSocket/polling
-                    # For now, we'll assume immediate approval for testing
-                    await self._approve_action(action_id, user_id)
-
                 # Execute the action
-                result = await self._execute_action(action_id, user_id)
-                results.append(result)
+                return await self._execute_action(
+                    action_data["id"],
+                    user_id,
+                    action_data=action_data
+                )
 
             except Exception as e:
-                print(f"❌ Error executing action step: {e}")
-                results.append(ActionResult(
+                logger.error("Error executing action step: %s", e)
+                return ActionResult(
                     success=False,
                     error=str(e)
-                ))
-
-        return results
+                )
 
-    async def _queue_action(
+    async def _queue_action_step(
         self,
         user_id: str,
         action_type: str,
@@ -121,23 +195,26 @@ class ActionExecutor:
         suggestion_id: Optional[str] = None,
         requires_approval: bool = True,
         priority: int = 5
-    ) -> str:
-        """Queue an action in the database"""
+    ) -> Dict[str, Any]:
+        """
+        Queue an action, approve it if required, and return its action_queue row
+        in a single database round trip
+        """
         try:
             # Validate suggestion_id is a valid UUID format, otherwise set to None
             valid_suggestion_id = None
             if suggestion_id:
-                try:
-                    UUID(suggestion_id)  # This will raise ValueError if not a valid UUID
+                if isinstance(suggestion_id, str) and len(suggestion_id) == 36 \
+                        and _UUID_RE.fullmatch(suggestion_id):
                     valid_suggestion_id = suggestion_id
-                    print(f"✅ Valid UUID for suggestion_id: {suggestion_id}")
-                except ValueError:
-                    print(f"⚠️ Invalid UUID format for suggestion_id: {suggestion_id}, setting to None")
-                    valid_suggestion_id = None
+                    logger.debug("Valid UUID for suggestion_id: %s", suggestion_id)
+                else:
+                    logger.warning("Invalid UUID format for suggestion_id: %s, setting to None", suggestion_id)
 
             # Call the Postgres function
-            result = supabase.rpc(
-                "queue_action",
+            supabase = await get_async_supabase()
+            result = await supabase.rpc(
+                "execute_action_step",
                 {
                     "p_user_id": user_id,
                     "p_suggestion_id": valid_suggestion_id,
@@ -148,18 +225,22 @@ class ActionExecutor:
                 }
             ).execute()
 
-            action_id = result.data
-            print(f"✅ Queued action {action_id} of type {action_type}")
-            return action_id
+            if not result.data:
+                raise ValueError(f"Failed to queue action of type {action_type}")
+
+            action_data = result.data[0]
+            logger.info("Queued action %s of type %s", action_data["id"], action_type)
+            return action_data
 
         except Exception as e:
-            print(f"❌ Error queuing action: {e}")
+            logger.error("Error queuing action: %s", e)
             raise
 
     async def _approve_action(self, action_id: str, user_id: str) -> bool:
         """Approve a pending action"""
         try:
-            result = supabase.rpc(
+            supabase = await get_async_supabase()
+            result = await supabase.rpc(
                 "approve_action",
                 {
                     "p_action_id": action_id,
@@ -167,55 +248,66 @@ class ActionExecutor:
                 }
             ).execute()
 
-            print(f"✅ Action {action_id} approved")
+            logger.info("Action %s approved", action_id)
             return result.data
 
         except Exception as e:
-            print(f"❌ Error approving action: {e}")
+            logger.error("Error approving action: %s", e)
             return False
 
-    async def _execute_action(self, action_id: str, user_id: str) -> ActionResult:
-        """Execute a queued action"""
+    async def _execute_action(
+        self,
+        action_id: str,
+        user_id: str,
+        action_data: Optional[Dict[str, Any]] = None
+    ) -> ActionResult:
+        """Execute a queued action, reusing its row if the caller already has it"""
+        executing_task = None
         try:
-            # Get action details from database
-            action = supabase.table("action_queue")\
-                .select("*")\
-                .eq("id", action_id)\
-                .eq("user_id", user_id)\
-                .single()\
-                .execute()
+            supabase = await get_async_supabase()
 
-            action_data = action.data
-            action_type = action_data["action_type"]
+            # Get action details from database
+            if action_data is None:
+                action = await supabase.table("action_queue")\
+                    .select("*")\
+                    .eq("id", action_id)\
+                    .eq("user_id", user_id)\
+                    .single()\
+                    .execute()
+                action_data = action.data
+
+            action_type = sys.intern(action_data["action_type"])
             action_params = action_data["action_data"]
-            metadata = as_action_metadata()
+            metadata = _action_metadata()
 
-            # Update status to executing
-            supabase.rpc(
-                "update_action_status",
-                {
-                    "p_action_id": action_id,
-                    "p_new_status": "executing"
-                }
-            ).execute()
+            # Mark the action as executing in the background so only the
+            # terminal status write sits on the critical path
+            executing_task = asyncio.create_task(self._mark_executing(action_id))
 
-            # Get appropriate agent
-            agent = await self._get_agent(action_type, user_id)
+            # Get appropriate agent, which stays checked out while it runs
+            async with self._checkout_agent(action_type, user_id) as agent:
+                if not agent:
+                    raise ValueError(f"No agent found for action type: {action_type}")
 
-            if not agent:
-                raise ValueError(f"No agent found for action type: {action_type}")
-
-            # Execute via agent
-            print(f"🚀 Executing action {action_id} via {agent.service_name}")
-            result = await agent.execute(action_type, action_params)
+                # Execute via agent
+                logger.info("Executing action %s via %s", action_id, agent.service_name)
+                result = await agent.execute(action_type, action_params)
 
             tool_meta = metadata.get(action_type)
             if tool_meta:
                 result.metadata.setdefault("tool", tool_meta)
 
+            # Token was rejected, so don't keep serving it from the cache
+            if not result.success and self._is_auth_failure(result.error):
+                self._invalidate_credentials(user_id)
+
+            # The executing write must land before the terminal status
+            await executing_task
+            executing_task = None
+
             # Update action status
             if result.success:
-                supabase.rpc(
+                await supabase.rpc(
                     "update_action_status",
                     {
                         "p_action_id": action_id,
@@ -223,9 +315,9 @@ class ActionExecutor:
                         "p_result": result.to_dict()
                     }
                 ).execute()
-                print(f"✅ Action {action_id} completed successfully")
+                logger.info("Action %s completed successfully", action_id)
             else:
-                supabase.rpc(
+                await supabase.rpc(
                     "update_action_status",
                     {
                         "p_action_id": action_id,
@@ -233,16 +325,20 @@ class ActionExecutor:
                         "p_error": result.error
                     }
                 ).execute()
-                print(f"❌ Action {action_id} failed: {result.error}")
+                logger.warning("Action %s failed: %s", action_id, result.error)
 
             return result
 
         except Exception as e:
-            print(f"❌ Error executing action {action_id}: {e}")
+            logger.error("Error executing action %s: %s", action_id, e)
+
+            if executing_task is not None:
+                await executing_task
 
             # Update action status to failed
             try:
-                supabase.rpc(
+                supabase = await get_async_supabase()
+                await supabase.rpc(
                     "update_action_status",
                     {
                         "p_action_id": action_id,
@@ -255,10 +351,39 @@ class ActionExecutor:
 
             return ActionResult(success=False, error=str(e))
 
+    async def _mark_executing(self, action_id: str) -> None:
+        """Set an action's status to executing, logging rather than raising on failure"""
+        try:
+            supabase = await get_async_supabase()
+            await supabase.rpc(
+                "update_action_status",
+                {
+                    "p_action_id": action_id,
+                    "p_new_status": "executing"
+                }
+            ).execute()
+        except Exception as e:
+            logger.warning("Failed to mark action %s as executing: %s", action_id, e)
+
+    @asynccontextmanager
+    async def _checkout_agent(self, action_type: str, user_id: str) -> AsyncIterator[Optional[BaseAgent]]:
+        """
+        Yield the agent for an action type while holding its (user_id, service) lock
+
+        Cached agents and their Google API clients are shared between steps and
+        requests, so they are only handed out to one user of the key at a time
+        """
+        service_name = action_type.split("_")[0]
+        async with self._service_locks.hold((user_id, service_name)):
+            yield await self._get_agent(action_type, user_id)
+
     async def _get_agent(self, action_type: str, user_id: str) -> Optional[BaseAgent]:
         """
         Get the appropriate agent for an action type
 
+        Only call this through _checkout_agent, which holds the lock for the
+        cached agent it may return
+
         Args:
             action_type: Type of action (e.g., 'gmail_send', 'calendar_create_event')
             user_id: User ID for getting OAuth tokens
@@ -275,8 +400,29 @@ class ActionExecutor:
         service_name = action_type.split("_")[0]  # Extract 'gmail' from 'gmail_send'
         credentials = await self._get_user_credentials(user_id, service_name)
 
-        # Initialize and return agent
-        return agent_class(user_id=user_id, credentials=credentials)
+        if not credentials:
+            return agent_class(user_id=user_id, credentials=credentials)
+
+        # Reuse the agent (and its API client) while the access token is unchanged
+        # and unexpired; a new token rebuilds the agent
+        key = (user_id, service_name)
+        now = time.monotonic()
+        cached = self._agent_cache.get(key)
+        if cached:
+            agent, access_token, expires_at = cached
+            if access_token == credentials["access_token"] and now < expires_at - self.CREDENTIAL_EXPIRY_MARGIN:
+                self._agent_cache.move_to_end(key)
+                return agent
+            del self._agent_cache[key]
+
+        # Initialize and return agent, cached for as long as its credentials are
+        agent = agent_class(user_id=user_id, credentials=credentials)
+        cred_entry = self._cred_cache.get((user_id, _PROVIDER_MAP[service_name]))
+        expires_at = cred_entry[1] if cred_entry else now + self.DEFAULT_CREDENTIAL_TTL
+        self._agent_cache[key] = (agent, credentials["access_token"], expires_at)
+        if len(self._agent_cache) > self.AGENT_CACHE_MAX_SIZE:
+            self._agent_cache.popitem(last=False)
+        return agent
 
     async def _get_user_credentials(
         self,
@@ -285,7 +431,8 @@ class ActionExecutor:
     ) -> Optional[Dict[str, Any]]:
         """
         Get user's OAuth credentials for a service
-        Automatically refreshes expired tokens
+        Automatically refreshes expired tokens and caches them in-process
+        until shortly before they expire
 
         Args:
             user_id: User ID
@@ -294,23 +441,76 @@ class ActionExecutor:
         Returns:
             Credentials dict or None
         """
-        try:
-            # Map service names to provider names in user_oauth_tokens table
-            provider_map = {
-                "gmail": "google",
-                "calendar": "google",
-                "drive": "google",
-                "notion": "notion",
-                "slack": "slack"
-            }
-
-            provider = provider_map.get(service_name)
-            if not provider:
-                print(f"⚠️ No provider mapping for service: {service_name}")
+        provider = _PROVIDER_MAP.get(service_name)
+        if not provider:
+            logger.warning("No provider mapping for service: %s", service_name)
+            return None
+
+        key = (user_id, provider)
+        cached = self._get_cached_credentials(key)
+        if cached is not None:
+            return cached
+
+        async with self._cred_locks.hold(key):
+            # Another task may have filled the cache while we waited
+            cached = self._get_cached_credentials(key)
+            if cached is not None:
+                return cached
+
+            token_data, expires_in = await self._load_user_credentials(
+                user_id, service_name, provider
+            )
+            if token_data is None:
                 return None
 
+            self._cred_cache[key] = (token_data, time.monotonic() + expires_in)
+            self._cred_cache.move_to_end(key)
+            if len(self._cred_cache) > self.CREDENTIAL_CACHE_MAX_SIZE:
+                self._cred_cache.popitem(last=False)
+            return dict(token_data)
+
+    def _get_cached_credentials(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        """Return a copy of cached credentials if they are not close to expiring"""
+        entry = self._cred_cache.get(key)
+        if entry is None:
+            return None
+
+        token_data, expires_at = entry
+        if time.monotonic() >= expires_at - self.CREDENTIAL_EXPIRY_MARGIN:
+            self._cred_cache.pop(key, None)
+            return None
+
+        self._cred_cache.move_to_end(key)
+        return dict(token_data)
+
+    def _invalidate_credentials(self, user_id: str) -> None:
+        """Drop all cached credentials and agents for a user"""
+        for key in [key for key in self._cred_cache if key[0] == user_id]:
+            self._cred_cache.pop(key, None)
+        for key in [key for key in self._agent_cache if key[0] == user_id]:
+            self._agent_cache.pop(key, None)
+
+    def _is_auth_failure(self, error: Optional[str]) -> bool:
+        """Check whether an agent error indicates a rejected OAuth token"""
+        return bool(error) and any(marker in error for marker in self.AUTH_FAILURE_MARKERS)
+
+    async def _load_user_credentials(
+        self,
+        user_id: str,
+        service_name: str,
+        provider: str
+    ) -> Tuple[Optional[Dict[str, Any]], float]:
+        """
+        Load credentials from the database, refreshing expired tokens
+
+        Returns:
+            Tuple of (credentials dict or None, seconds until the token expires)
+        """
+        try:
+            supabase = await get_async_supabase()
+
             # Query user_oauth_tokens table
-            result = supabase.table("user_oauth_tokens")\
+            result = await supabase.table("user_oauth_tokens")\
                 .select("access_token, refresh_token, expires_at, scopes")\
                 .eq("user_id", user_id)\
                 .eq("provider", provider)\
@@ -319,72 +519,61 @@ class ActionExecutor:
                 .execute()
 
             if not result.data or len(result.data) == 0:
-                print(f"⚠️ No credentials found for user {user_id}, provider {provider}")
-                return None
+                logger.warning("No credentials found for user %s, provider %s", user_id, provider)
+                return None, 0
 
             token_data = result.data[0]
+            token_data["access_token"] = decrypt_token(token_data.get("access_token"))
+            token_data["refresh_token"] = decrypt_token(token_data.get("refresh_token"))
+            expires_in = self.DEFAULT_CREDENTIAL_TTL
 
             # Check if token is expired and refresh if needed
             if token_data.get("expires_at"):
-                from datetime import datetime
-                import re
-                # Remove timezone info for comparison (both should be naive)
-                expires_at_str = token_data["expires_at"]
-                # Handle both ISO formats with and without timezone
-                if expires_at_str.endswith('Z'):
-                    expires_at_str = expires_at_str[:-1]
-                elif '+' in expires_at_str:
-                    # Has timezone offset like +00:00, strip it
-                    expires_at_str = expires_at_str.split('+')[0]
-                elif re.search(r'T.*-\d{2}:\d{2}$', expires_at_str):
-                    # Has negative timezone offset like -07:00 at the end
-                    # Only strip the timezone part after the time
-                    expires_at_str = re.sub(r'-\d{2}:\d{2}$', '', expires_at_str)
-
-                expires_at = datetime.fromisoformat(expires_at_str)
-                now = datetime.utcnow()
+                # fromisoformat parses +/-HH:MM offsets directly; naive values are UTC
+                expires_at = datetime.fromisoformat(token_data["expires_at"].replace('Z', '+00:00'))
+                if expires_at.tzinfo is None:
+                    expires_at = expires_at.replace(tzinfo=timezone.utc)
+                now = datetime.now(timezone.utc)
+                expires_in = (expires_at - now).total_seconds()
 
                 # If token is expired, refresh it
                 if expires_at <= now:
-                    print(f"🔄 Token expired for {service_name}, refreshing...")
+                    logger.info("Token expired for %s, refreshing...", service_name)
 
                     if provider == "google" and token_data.get("refresh_token"):
                         # Refresh Google OAuth token
-                        from app.services.google_oauth import google_oauth_service
                         new_tokens = await google_oauth_service.refresh_access_token(
                             token_data["refresh_token"]
                         )
 
                         # Update token in database
                         expires_in = new_tokens.get("expires_in", 3600)
-                        new_expires_at = datetime.utcnow().timestamp() + expires_in
+                        refreshed_at = time.time()
 
-                        supabase.table("user_oauth_tokens")\
+                        await supabase.table("user_oauth_tokens")\
                             .update({
-                                "access_token": new_tokens["access_token"],
-                                "expires_at": datetime.fromtimestamp(new_expires_at).isoformat(),
-                                "updated_at": datetime.utcnow().isoformat()
+                                "access_token": encrypt_token(new_tokens["access_token"]),
+                                "expires_at": utc_timestamp(refreshed_at + expires_in),
+                                "updated_at": utc_timestamp(refreshed_at)
                             })\
                             .eq("user_id", user_id)\
                             .eq("provider", provider)\
                             .execute()
 
                         token_data["access_token"] = new_tokens["access_token"]
-                        print(f"✅ Refreshed token for {service_name}")
+                        logger.info("Refreshed token for %s", service_name)
                     else:
-                        print(f"⚠️ Cannot refresh token - no refresh_token available")
-                        return None
+                        logger.warning("Cannot refresh token - no refresh_token available")
+                        return None, 0
 
             # Add token_type since it's always "Bearer" for OAuth
             token_data["token_type"] = "Bearer"
-            print(f"✅ Found credentials for {service_name} (provider: {provider})")
-            return token_data
+            logger.debug("Found credentials for %s (provider: %s)", service_name, provider)
+            return token_data, expires_in
 
         except Exception as e:
-            print(f"❌ Error getting credentials: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
+            logger.exception("Error getting credentials: %s", e)
+            return None, 0
 
 
 # Global instance
@@ -1,11 +1,40 @@
-from typing import Optional, Dict, Any, List
-from datetime import datetime, timedelta
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Iterable, List, Set, Tuple
+from datetime import datetime, timezone
 from uuid import UUID
-from app.core.database import execute_query
+from app.core.database import execute_query, execute_rpc
+
+# Optional context fields only overwrite stored values when non-empty
+_OPTIONAL_CONTEXT_FIELDS = ("context_type", "domain", "activity_summary")
+
+# Only the columns get_recent_app_context returns
+_RECENT_CONTEXT_COLUMNS = ("app_name", "context_type", "domain", "activity_summary", "duration_seconds", "start_time")
 
 
 class AppSessionService:
 
+    # Heartbeats for an app session that is already open are buffered, keeping
+    # only the latest state per app, and each app session is written at most
+    # once per HEARTBEAT_WRITE_INTERVAL seconds
+    HEARTBEAT_FLUSH_DELAY = 0.5
+    HEARTBEAT_WRITE_INTERVAL = 30
+    # App sessions not written for this long are dropped from the cache, well
+    # past the default 5 minute inactivity timeout; their next heartbeat writes through
+    ACTIVE_SESSION_TTL = 600
+
+    # (user_id, session_id, app_name) -> (active app session id, monotonic time last written),
+    # oldest write first
+    _active_sessions: "OrderedDict[Tuple[str, str, str], Tuple[str, float]]" = OrderedDict()
+    # Indexes over _active_sessions so ending apps doesn't scan every cached key:
+    # (user_id, session_id) -> app names, and app session id -> key
+    _session_apps: Dict[Tuple[str, str], Set[str]] = {}
+    _session_keys: Dict[str, Tuple[str, str, str]] = {}
+    # (user_id, session_id, app_name) -> latest buffered heartbeat
+    _pending_heartbeats: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    _flush_task: Optional[asyncio.Task] = None
+
     @staticmethod
     async def create_or_update_app_session(
         user_id: str,
@@ -17,89 +46,181 @@ class AppSessionService:
         domain: str = "",
         activity_summary: str = ""
     ) -> str:
+        key = (user_id, session_id, app_name)
+        heartbeat = {
+            "user_id": user_id,
+            "session_id": session_id,
+            "app_name": app_name,
+            "window_title": window_title,
+            "bundle_id": bundle_id,
+            "context_type": context_type,
+            "domain": domain,
+            "activity_summary": activity_summary
+        }
+
+        active = AppSessionService._active_sessions.get(key)
+        if active:
+            AppSessionService._buffer_heartbeat(key, heartbeat)
+            return active[0]
+
         try:
-            active_sessions = await execute_query(
-                table="app_sessions",
-                operation="select",
-                filters={
-                    "user_id": user_id,
-                    "session_id": session_id,
-                    "app_name": app_name,
-                    "is_active": True
-                },
-                limit=1
+            app_session_id = await execute_rpc(
+                "upsert_app_session",
+                {f"p_{field}": value for field, value in heartbeat.items()}
             )
 
-            current_time = datetime.now()
+            if app_session_id:
+                AppSessionService._remember_active_session(key, app_session_id)
 
-            if active_sessions:
-                app_session_id = active_sessions[0]["id"]
+            return app_session_id
 
-                update_data = {
-                    "window_title": window_title,
-                    "bundle_id": bundle_id,
-                    "last_activity": current_time.isoformat(),
-                    "updated_at": current_time.isoformat()
-                }
+        except Exception as e:
+            return None
 
-                if context_type:
-                    update_data["context_type"] = context_type
-                if domain:
-                    update_data["domain"] = domain
-                if activity_summary:
-                    update_data["activity_summary"] = activity_summary
-
-                await execute_query(
-                    table="app_sessions",
-                    operation="update",
-                    data=update_data,
-                    filters={"id": app_session_id}
-                )
+    @staticmethod
+    def _remember_active_session(key: Tuple[str, str, str], app_session_id: str) -> None:
+        # Opening an app ends the user's other apps in that session (end_previous_sessions_trigger)
+        user_id, session_id, app_name = key
+        AppSessionService._forget_active_sessions(
+            user_id, session_id,
+            AppSessionService._session_apps.get((user_id, session_id), set()) - {app_name}
+        )
 
-                return app_session_id
-
-            else:
-                app_session_data = {
-                    "user_id": user_id,
-                    "session_id": session_id,
-                    "app_name": app_name,
-                    "window_title": window_title,
-                    "bundle_id": bundle_id,
-                    "context_type": context_type or "general",
-                    "domain": domain or "general",
-                    "activity_summary": activity_summary,
-                    "start_time": current_time.isoformat(),
-                    "last_activity": current_time.isoformat(),
-                    "is_active": True
-                }
+        AppSessionService._set_active_session(key, app_session_id, time.monotonic())
+
+    @staticmethod
+    def _set_active_session(key: Tuple[str, str, str], app_session_id: str, written_at: float) -> None:
+        previous = AppSessionService._active_sessions.get(key)
+        if previous and previous[0] != app_session_id:
+            AppSessionService._session_keys.pop(previous[0], None)
+
+        AppSessionService._active_sessions[key] = (app_session_id, written_at)
+        AppSessionService._active_sessions.move_to_end(key)
+        AppSessionService._session_keys[app_session_id] = key
+        AppSessionService._session_apps.setdefault(key[:2], set()).add(key[2])
 
-                result = await execute_query(
-                    table="app_sessions",
-                    operation="insert",
-                    data=app_session_data
+        AppSessionService._evict_stale_sessions(written_at - AppSessionService.ACTIVE_SESSION_TTL)
+
+    @staticmethod
+    def _evict_stale_sessions(written_before: float) -> None:
+        # Entries are kept in write order, so stale ones are all at the front.
+        # Abandoned sessions are never ended explicitly, so this is what bounds the cache
+        active = AppSessionService._active_sessions
+        while active:
+            key, (_, last_written) = next(iter(active.items()))
+            if last_written >= written_before:
+                break
+            AppSessionService._drop_active_session(key)
+
+    @staticmethod
+    def _drop_active_session(key: Tuple[str, str, str]) -> None:
+        entry = AppSessionService._active_sessions.pop(key, None)
+        if entry is None:
+            return
+
+        AppSessionService._session_keys.pop(entry[0], None)
+        apps = AppSessionService._session_apps.get(key[:2])
+        if apps is not None:
+            apps.discard(key[2])
+            if not apps:
+                del AppSessionService._session_apps[key[:2]]
+
+    @staticmethod
+    def _forget_active_sessions(user_id: str, session_id: str, app_names: Iterable[str]) -> None:
+        # Drop buffered heartbeats too so a flush can't reopen an ended session
+        for app_name in list(app_names):
+            key = (user_id, session_id, app_name)
+            AppSessionService._drop_active_session(key)
+            AppSessionService._pending_heartbeats.pop(key, None)
+
+    @staticmethod
+    def _buffer_heartbeat(key: Tuple[str, str, str], heartbeat: Dict[str, Any]) -> None:
+        previous = AppSessionService._pending_heartbeats.get(key)
+        if previous:
+            for field in _OPTIONAL_CONTEXT_FIELDS:
+                if not heartbeat[field]:
+                    heartbeat[field] = previous[field]
+
+        AppSessionService._pending_heartbeats[key] = heartbeat
+
+        last_written = AppSessionService._active_sessions[key][1]
+        AppSessionService._schedule_flush(
+            last_written + AppSessionService.HEARTBEAT_WRITE_INTERVAL - time.monotonic()
+        )
+
+    @staticmethod
+    def _schedule_flush(delay: float) -> None:
+        if AppSessionService._flush_task is None:
+            AppSessionService._flush_task = asyncio.create_task(
+                AppSessionService._flush_heartbeats_later(
+                    max(delay, AppSessionService.HEARTBEAT_FLUSH_DELAY)
                 )
+            )
 
-                app_session_id = result[0]["id"] if result else None
-                return app_session_id
+    @staticmethod
+    async def _flush_heartbeats_later(delay: float) -> None:
+        await asyncio.sleep(delay)
+        AppSessionService._flush_task = None
+
+        now = time.monotonic()
+        interval = AppSessionService.HEARTBEAT_WRITE_INTERVAL
+        due = [
+            key for key in AppSessionService._pending_heartbeats
+            if key not in AppSessionService._active_sessions
+            or now - AppSessionService._active_sessions[key][1] >= interval
+        ]
+        await AppSessionService.flush_heartbeats(due)
+
+        # Reschedule for heartbeats whose app session was written too recently
+        next_due = [
+            AppSessionService._active_sessions[key][1] + interval
+            for key in AppSessionService._pending_heartbeats
+            if key in AppSessionService._active_sessions
+        ]
+        if next_due:
+            AppSessionService._schedule_flush(min(next_due) - time.monotonic())
+
+    @staticmethod
+    async def flush_heartbeats(keys: Optional[List[Tuple[str, str, str]]] = None) -> None:
+        if keys is None:
+            keys = list(AppSessionService._pending_heartbeats)
+        pending = {
+            key: AppSessionService._pending_heartbeats.pop(key)
+            for key in keys
+            if key in AppSessionService._pending_heartbeats
+        }
+        if not pending:
+            return
+
+        try:
+            rows = await execute_rpc(
+                "upsert_app_sessions",
+                {"p_sessions": list(pending.values())}
+            )
+
+            # A session ended since it was cached gets a new id from the upsert
+            written_at = time.monotonic()
+            for key, row in zip(pending.keys(), rows or []):
+                AppSessionService._set_active_session(key, row["app_session_id"], written_at)
 
         except Exception as e:
-            return None
+            # Next heartbeat for these apps writes through again
+            for key in pending:
+                AppSessionService._drop_active_session(key)
 
     @staticmethod
     async def end_app_session(app_session_id: str, reason: str = "manual") -> bool:
-        try:
-            current_time = datetime.now()
+        key = AppSessionService._session_keys.get(app_session_id)
+        if key:
+            AppSessionService._forget_active_sessions(key[0], key[1], (key[2],))
 
-            await execute_query(
-                table="app_sessions",
-                operation="update",
-                data={
-                    "end_time": current_time.isoformat(),
-                    "is_active": False,
-                    "transition_reason": reason,
-                    "updated_at": current_time.isoformat()
-                },
-                filters={"id": app_session_id}
+        try:
+            await execute_rpc(
+                "end_app_session",
+                {
+                    "p_app_session_id": app_session_id,
+                    "p_reason": reason
+                }
             )
 
             return True
@@ -109,36 +230,35 @@ class AppSessionService:
 
     @staticmethod
     async def end_inactive_sessions(user_id: str, session_id: str, timeout_minutes: int = 5) -> int:
-        try:
-            cutoff_time = datetime.now() - timedelta(minutes=timeout_minutes)
+        # Write buffered activity first so apps still in use aren't seen as idle
+        await AppSessionService.flush_heartbeats([
+            (user_id, session_id, app_name)
+            for app_name in AppSessionService._session_apps.get((user_id, session_id), ())
+        ])
 
-            inactive_sessions = await execute_query(
-                table="app_sessions",
-                operation="select",
-                filters={
-                    "user_id": user_id,
-                    "session_id": session_id,
-                    "is_active": True
+        try:
+            rows = await execute_rpc(
+                "end_inactive_app_sessions",
+                {
+                    "p_user_id": user_id,
+                    "p_session_id": session_id,
+                    "p_timeout_minutes": timeout_minutes,
+                    "p_reason": "timeout"
                 }
             )
 
-            ended_count = 0
-            for session in inactive_sessions or []:
-                last_activity = datetime.fromisoformat(session["last_activity"])
-                if last_activity < cutoff_time:
-                    await AppSessionService.end_app_session(
-                        session["id"],
-                        reason="timeout"
-                    )
-                    ended_count += 1
+            # Only the ended apps lose their cached session and buffered heartbeat
+            AppSessionService._forget_active_sessions(
+                user_id, session_id, (row["app_name"] for row in rows or [])
+            )
 
-            return ended_count
+            return len(rows or [])
 
         except Exception as e:
             return 0
 
     @staticmethod
-    async def get_active_app_sessions(user_id: str, session_id: str = None) -> List[Dict]:
+    async def get_active_app_sessions(user_id: str, session_id: str = None, limit: int = 50) -> List[Dict]:
         try:
             filters = {
                 "user_id": user_id,
@@ -153,7 +273,8 @@ class AppSessionService:
                 operation="select",
                 filters=filters,
                 order_by="last_activity",
-                ascending=False
+                ascending=False,
+                limit=limit
             )
 
             return sessions or []
@@ -162,42 +283,32 @@ class AppSessionService:
             return []
 
     @staticmethod
-    async def get_app_usage_summary(user_id: str, date: str = None) -> Dict[str, Any]:
+    async def get_app_usage_summary(user_id: str, date: str = None, top_k: Optional[int] = 20) -> Dict[str, Any]:
         try:
             if not date:
-                date = datetime.now().date().isoformat()
-
-            sessions = await execute_query(
-                table="app_sessions",
-                operation="select",
-                filters={
-                    "user_id": user_id
+                date = datetime.now(timezone.utc).date().isoformat()
+
+            # top_k=None returns every app; totals always cover the whole day
+            rows = await execute_rpc(
+                "get_app_usage_summary",
+                {
+                    "p_user_id": user_id,
+                    "p_date": date,
+                    "p_limit": top_k
                 }
             )
 
-            if not sessions:
+            if not rows:
                 return {"date": date, "total_apps": 0, "total_minutes": 0, "app_breakdown": {}}
 
-            app_usage = {}
-            total_minutes = 0
-
-            for session in sessions:
-                session_date = session["start_time"][:10]
-                if session_date != date:
-                    continue
-
-                app_name = session["app_name"]
-                duration = session.get("duration_seconds", 0) or 0
-                minutes = max(1, duration // 60)
-
-                app_usage[app_name] = app_usage.get(app_name, 0) + minutes
-                total_minutes += minutes
+            # Rows arrive aggregated per app and sorted by minutes descending
+            app_breakdown = {row["app_name"]: row["total_minutes"] for row in rows}
 
             return {
                 "date": date,
-                "total_apps": len(app_usage),
-                "total_minutes": total_minutes,
-                "app_breakdown": dict(sorted(app_usage.items(), key=lambda x: x[1], reverse=True))
+                "total_apps": rows[0]["day_total_apps"],
+                "total_minutes": rows[0]["day_total_minutes"],
+                "app_breakdown": app_breakdown
             }
 
         except Exception as e:
@@ -209,6 +320,7 @@ class AppSessionService:
             sessions = await execute_query(
                 table="app_sessions",
                 operation="select",
+                columns=_RECENT_CONTEXT_COLUMNS,
                 filters={"user_id": user_id},
                 order_by="start_time",
                 ascending=False,
@@ -240,14 +352,15 @@ class AppSessionService:
         activity_summary: str = None
     ) -> bool:
         try:
-            update_data = {"updated_at": datetime.now().isoformat()}
-
-            if context_type:
-                update_data["context_type"] = context_type
-            if domain:
-                update_data["domain"] = domain
-            if activity_summary:
-                update_data["activity_summary"] = activity_summary
+            # updated_at is set by the app_sessions update trigger
+            update_data = {
+                field: value
+                for field, value in zip(_OPTIONAL_CONTEXT_FIELDS, (context_type, domain, activity_summary))
+                if value
+            }
+
+            if not update_data:
+                return True
 
             await execute_query(
                 table="app_sessions",
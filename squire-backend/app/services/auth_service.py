@@ -1,23 +1,101 @@
 """
 Authentication service using Supabase Auth
 """
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from supabase import Client
-from app.core.database import supabase
+from typing import Optional, Dict, Any, Set, Tuple
+from collections import OrderedDict
+import jwt
+from jwt import PyJWK, PyJWKError, PyJWTError as JWTError
+from supabase_auth import AsyncGoTrueClient
+from postgrest import ReturnMethod
+from app.core.database import get_async_supabase, get_async_auth_client
 from app.core.config import settings
-import httpx
+from app.core.crypto import encrypt_token
+from app.core.http import http_client
+import asyncio
+import logging
+import hashlib
+import orjson
 import json
+import time
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+
+def utc_timestamp(seconds: Optional[float] = None) -> str:
+    """
+    UTC time as ISO-8601 to the second, without building a datetime
+
+    Every writer of user_oauth_tokens timestamps uses this, so stored values
+    share one format. Defaults to now; pass epoch seconds for another time.
+    """
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+
+# Google scopes requested for calendar/gmail action execution
+GOOGLE_OAUTH_SCOPES = (
+    "https://www.googleapis.com/auth/userinfo.email",
+    "https://www.googleapis.com/auth/userinfo.profile",
+    "https://www.googleapis.com/auth/calendar",
+    "https://www.googleapis.com/auth/calendar.events",
+    "https://www.googleapis.com/auth/gmail.modify"
+)
+GOOGLE_OAUTH_SCOPE_STRING = " ".join(GOOGLE_OAUTH_SCOPES)
+
+# Copied per request - Supabase adds redirect_to to the query params it is given
+GOOGLE_OAUTH_QUERY_PARAMS = MappingProxyType({
+    "prompt": "consent",  # Force consent screen (not just account selection)
+    "access_type": "offline",
+    "include_granted_scopes": "true",
+    "scope": GOOGLE_OAUTH_SCOPE_STRING
+})
 
 
 class AuthService:
     """Service for handling authentication with Supabase"""
 
+    # Asymmetric algorithms Supabase signs access tokens with
+    JWKS_ALGORITHMS = ["RS256", "ES256"]
+    JWKS_CACHE_TTL = 600
+    # Unknown kids trigger a refetch at most this often
+    JWKS_MIN_REFRESH_INTERVAL = 30
+    # Verified claims are reused for at most this long, and never past the token's exp
+    CLAIMS_CACHE_TTL = 300
+    CLAIMS_CACHE_MAX_SIZE = 50_000
+    # last_active only needs to be accurate to this many seconds
+    LAST_ACTIVE_GRANULARITY = 300
+    LAST_ACTIVE_MAX_TRACKED = 10_000
+    # OAuth token upserts are batched for up to this many seconds or rows
+    OAUTH_TOKEN_FLUSH_DELAY = 0.05
+    OAUTH_TOKEN_BATCH_SIZE = 32
+    # Failed upserts are retried after this many seconds, up to this many times in a row
+    OAUTH_TOKEN_RETRY_DELAY = 5
+    OAUTH_TOKEN_MAX_ATTEMPTS = 3
+
     def __init__(self):
-        self.supabase: Client = supabase
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        # Settings read once rather than on every verify_token call
+        self._jwt_secret = settings.SUPABASE_JWT_SECRET
+        self._jwt_algorithms = [settings.JWT_ALGORITHM]
+        self._jwt_options = {"verify_aud": False}  # Supabase uses specific audience
+        self._background_tasks: Set[asyncio.Task] = set()
+        # user_id -> monotonic time of the last last_active write
+        self._last_active_touched: Dict[str, float] = {}
+        # (user_id, provider) -> token row waiting to be upserted
+        self._pending_oauth_tokens: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._oauth_flush_task: Optional[asyncio.Task] = None
+        self._oauth_flush_lock = asyncio.Lock()
+        self._failed_oauth_flushes = 0
+        self._oauth_retry_at = 0.0
+        self.jwks_url = f"{settings.SUPABASE_URL}/auth/v1/.well-known/jwks.json"
+        self._jwks: Dict[str, PyJWK] = {}
+        self._jwks_fetched_at = float("-inf")
+        self._jwks_expires_at = float("-inf")
+        # blake2b(token) -> (claims, expiry as epoch seconds), least recently used first
+        self._claims_cache: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+    async def _auth(self) -> AsyncGoTrueClient:
+        """Get the shared async Supabase auth client"""
+        return (await get_async_auth_client()).auth
 
     async def sign_up(self, email: str, password: str, user_metadata: Dict[str, Any] = None) -> Dict[str, Any]:
         """
@@ -33,7 +111,8 @@ class AuthService:
         """
         try:
             # Sign up with Supabase Auth
-            response = self.supabase.auth.sign_up({
+            auth = await self._auth()
+            response = await auth.sign_up({
                 "email": email,
                 "password": password,
                 "options": {
@@ -69,16 +148,16 @@ class AuthService:
             Dict containing user info and tokens
         """
         try:
-            response = self.supabase.auth.sign_in_with_password({
+            auth = await self._auth()
+            response = await auth.sign_in_with_password({
                 "email": email,
                 "password": password
             })
 
             if response.user and response.session:
-                # Update last_active time
-                self.supabase.table("user_profiles").update({
-                    "last_active": datetime.utcnow().isoformat()
-                }).eq("id", response.user.id).execute()
+                # Update last_active time without holding up the response
+                if self._should_touch_last_active(response.user.id):
+                    self._run_in_background(self._touch_last_active(response.user.id))
 
                 return {
                     "user": response.user,
@@ -92,6 +171,43 @@ class AuthService:
         except Exception as e:
             raise Exception(f"Sign in error: {str(e)}")
 
+    def _run_in_background(self, coro) -> None:
+        """Schedule a coroutine, keeping a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _should_touch_last_active(self, user_id: str) -> bool:
+        """Allow one last_active write per user per LAST_ACTIVE_GRANULARITY seconds"""
+        now = time.monotonic()
+        last_touched = self._last_active_touched.get(user_id)
+        if last_touched is not None and now - last_touched < self.LAST_ACTIVE_GRANULARITY:
+            return False
+
+        if len(self._last_active_touched) >= self.LAST_ACTIVE_MAX_TRACKED:
+            self._last_active_touched = {
+                uid: touched for uid, touched in self._last_active_touched.items()
+                if now - touched < self.LAST_ACTIVE_GRANULARITY
+            }
+        self._last_active_touched[user_id] = now
+        return True
+
+    async def _touch_last_active(self, user_id: str) -> None:
+        """
+        Record a user's last activity time
+
+        Args:
+            user_id: User's ID
+        """
+        try:
+            client = await get_async_supabase()
+            await client.table("user_profiles").update({
+                "last_active": utc_timestamp()
+            }).eq("id", user_id).execute()
+
+        except Exception as e:
+            logger.warning("Failed to update last_active: %s", e)
+
     async def sign_out(self, access_token: str) -> bool:
         """
         Sign out the current user
@@ -103,7 +219,9 @@ class AuthService:
             True if successful
         """
         try:
-            self.supabase.auth.sign_out()
+            self._claims_cache.pop(self._claims_cache_key(access_token), None)
+            auth = await self._auth()
+            await auth.admin.sign_out(access_token, scope="local")
             return True
         except Exception as e:
             raise Exception(f"Sign out error: {str(e)}")
@@ -119,7 +237,8 @@ class AuthService:
             Dict containing new tokens
         """
         try:
-            response = self.supabase.auth.refresh_session(refresh_token)
+            auth = await self._auth()
+            response = await auth.refresh_session(refresh_token)
 
             if response.session:
                 return {
@@ -135,7 +254,7 @@ class AuthService:
 
     async def verify_token(self, token: str) -> Optional[Dict[str, Any]]:
         """
-        Verify and decode a JWT token
+        Verify and decode a JWT token, reusing claims verified earlier
 
         Args:
             token: JWT token to verify
@@ -143,64 +262,161 @@ class AuthService:
         Returns:
             Decoded token payload if valid, None otherwise
         """
-        try:
-            # If JWT secret is not set, use Supabase's get_user method
-            if not settings.SUPABASE_JWT_SECRET:
-                response = self.supabase.auth.get_user(token)
-                if response and response.user:
-                    return {
-                        "sub": response.user.id,
-                        "email": response.user.email,
-                        "user_metadata": response.user.user_metadata,
-                        "aud": response.user.aud,
-                        "role": response.user.role
-                    }
-                return None
+        key = self._claims_cache_key(token)
+        cached = self._claims_cache.get(key)
+        if cached:
+            if cached[1] > time.time():
+                self._claims_cache.move_to_end(key)
+                return cached[0]
+            del self._claims_cache[key]
+
+        claims = await self._decode_token(token)
+        if claims is not None:
+            self._cache_claims(key, claims)
+        return claims
+
+    @staticmethod
+    def _claims_cache_key(token: str) -> bytes:
+        # Hash so the cache doesn't hold raw bearer tokens
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def _cache_claims(self, key: bytes, claims: Dict[str, Any]) -> None:
+        """Cache verified claims until the token expires, capped at CLAIMS_CACHE_TTL"""
+        expires_at = time.time() + self.CLAIMS_CACHE_TTL
+        if claims.get("exp"):
+            expires_at = min(expires_at, claims["exp"])
+
+        self._claims_cache[key] = (claims, expires_at)
+        if len(self._claims_cache) > self.CLAIMS_CACHE_MAX_SIZE:
+            self._claims_cache.popitem(last=False)
+
+    async def _decode_token(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        Verify a JWT token's signature and expiry
+
+        Args:
+            token: JWT token to verify
 
+        Returns:
+            Decoded token payload if valid, None otherwise
+        """
+        try:
             # Verify with JWT secret
-            payload = jwt.decode(
-                token,
-                settings.SUPABASE_JWT_SECRET,
-                algorithms=[settings.JWT_ALGORITHM],
-                options={"verify_aud": False}  # Supabase uses specific audience
-            )
-            return payload
+            if self._jwt_secret:
+                return jwt.decode(
+                    token,
+                    self._jwt_secret,
+                    algorithms=self._jwt_algorithms,
+                    options=self._jwt_options
+                )
+
+            # Otherwise verify against the project's published signing keys
+            header = jwt.get_unverified_header(token)
+            signing_key = await self._get_signing_key(header.get("kid"))
+            if signing_key:
+                return jwt.decode(
+                    token,
+                    signing_key.key,
+                    algorithms=self.JWKS_ALGORITHMS,
+                    options=self._jwt_options
+                )
+
+            # Legacy HS256 projects publish no keys - fall back to Supabase's get_user method
+            auth = await self._auth()
+            response = await auth.get_user(token)
+            if response and response.user:
+                return {
+                    "sub": response.user.id,
+                    "email": response.user.email,
+                    "user_metadata": response.user.user_metadata,
+                    "aud": response.user.aud,
+                    "role": response.user.role
+                }
+            return None
 
         except JWTError as e:
-            print(f"❌ Token verification failed: {str(e)}")
+            logger.debug("Token verification failed: %s", e)
             return None
         except Exception as e:
-            print(f"❌ Token verification error: {str(e)}")
+            logger.warning("Token verification error: %s", e)
             return None
 
-    async def get_user(self, token: str) -> Optional[Dict[str, Any]]:
+    async def _get_signing_key(self, kid: Optional[str]) -> Optional[PyJWK]:
+        """
+        Look up a signing key in the cached JWKS, refetching once on an unknown kid
+
+        Args:
+            kid: Key ID from the token header
+
+        Returns:
+            The matching JWK, or None if the project publishes no matching key
+        """
+        if time.monotonic() >= self._jwks_expires_at:
+            await self._refresh_jwks()
+
+        signing_key = self._jwks.get(kid)
+        if signing_key is None and self._jwks_refreshable():
+            # Keys may have been rotated since the last fetch
+            await self._refresh_jwks()
+            signing_key = self._jwks.get(kid)
+
+        return signing_key
+
+    def _jwks_refreshable(self) -> bool:
+        return time.monotonic() - self._jwks_fetched_at >= self.JWKS_MIN_REFRESH_INTERVAL
+
+    async def _refresh_jwks(self) -> None:
+        """Fetch the project's JWKS and cache its keys by kid"""
+        self._jwks_fetched_at = time.monotonic()
+        try:
+            response = await http_client.get(self.jwks_url, timeout=10.0)
+            response.raise_for_status()
+            keys = orjson.loads(response.content).get("keys", [])
+
+            jwks = {}
+            for key in keys:
+                try:
+                    jwks[key.get("kid")] = PyJWK(key)
+                except PyJWKError:
+                    continue  # Skip key types this build can't verify
+
+            self._jwks = jwks
+            self._jwks_expires_at = self._jwks_fetched_at + self.JWKS_CACHE_TTL
+
+        except Exception as e:
+            logger.warning("Failed to fetch JWKS: %s", e)
+            self._jwks_expires_at = self._jwks_fetched_at + self.JWKS_MIN_REFRESH_INTERVAL
+
+    async def get_user(self, token: str, claims: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
         """
         Get user details from token
 
         Args:
-            token: User's access token
+            token: User's access token, only verified when claims aren't given
+            claims: Claims already returned by verify_token for this token
 
         Returns:
             User details if valid
         """
         try:
-            response = self.supabase.auth.get_user(token)
+            if claims is None:
+                claims = await self.verify_token(token)
 
-            if response and response.user:
+            if claims:
                 # For now, skip profile query and just return user info
                 # The profile query was failing due to RLS
                 result = {
-                    "id": response.user.id,
-                    "email": response.user.email,
+                    "id": claims["sub"],
+                    "email": claims.get("email"),
                     "profile": None,  # Skip profile for now
-                    "metadata": response.user.user_metadata
+                    "metadata": claims.get("user_metadata", {})
                 }
                 return result
 
             return None
 
         except Exception as e:
-            print(f"❌ Error getting user: {str(e)}")
+            logger.warning("Error getting user: %s", e)
             return None
 
 
@@ -227,33 +443,15 @@ class AuthService:
 
             # ✅ Force account selection for Google OAuth + Request calendar/gmail scopes
             if provider == "google":
-                # Request calendar scopes for action execution
-                google_scopes = [
-                    "https://www.googleapis.com/auth/userinfo.email",
-                    "https://www.googleapis.com/auth/userinfo.profile",
-                    "https://www.googleapis.com/auth/calendar",
-                    "https://www.googleapis.com/auth/calendar.events",
-                    "https://www.googleapis.com/auth/gmail.modify"
-                ]
-
                 # Force consent screen to ensure new scopes are granted
-                oauth_params["options"]["queryParams"] = {
-                    "prompt": "consent",  # Force consent screen (not just account selection)
-                    "access_type": "offline",
-                    "include_granted_scopes": "true",
-                    "scope": " ".join(google_scopes)
-                }
+                oauth_params["options"]["queryParams"] = dict(GOOGLE_OAUTH_QUERY_PARAMS)
 
                 # Also set top-level query_params for maximum reliability
-                oauth_params["query_params"] = {
-                    "prompt": "consent",  # Force consent screen
-                    "access_type": "offline",
-                    "include_granted_scopes": "true",
-                    "scope": " ".join(google_scopes)
-                }
+                oauth_params["query_params"] = dict(GOOGLE_OAUTH_QUERY_PARAMS)
 
-            print(f"📋 [OAuth] Request params: {oauth_params}")
-            response = self.supabase.auth.sign_in_with_oauth(oauth_params)
+            logger.debug("[OAuth] Request params: %s", oauth_params)
+            auth = await self._auth()
+            response = await auth.sign_in_with_oauth(oauth_params)
 
             return {
                 "url": response.url,
@@ -277,7 +475,8 @@ class AuthService:
         """
         try:
             # Exchange code for session
-            response = self.supabase.auth.exchange_code_for_session({
+            auth = await self._auth()
+            response = await auth.exchange_code_for_session({
                 "auth_code": code
             })
 
@@ -292,31 +491,26 @@ class AuthService:
                     scopes = []
                     if provider == "google":
                         # These are the scopes we request in sign_in_with_oauth
-                        scopes = [
-                            "https://www.googleapis.com/auth/userinfo.email",
-                            "https://www.googleapis.com/auth/userinfo.profile",
-                            "https://www.googleapis.com/auth/calendar",
-                            "https://www.googleapis.com/auth/calendar.events",
-                            "https://www.googleapis.com/auth/gmail.modify"
-                        ]
-                        print(f"📋 [OAuth] Setting Google scopes to requested scopes: {scopes}")
+                        scopes = list(GOOGLE_OAUTH_SCOPES)
+                        logger.debug("[OAuth] Setting Google scopes to requested scopes: %s", scopes)
 
                     # Also try to get scopes from session if available
                     if hasattr(response.user, 'user_metadata'):
                         scopes_str = response.user.user_metadata.get('provider_scopes', '')
                         if scopes_str:
-                            print(f"📋 [OAuth] Found scopes in user_metadata: {scopes_str}")
+                            logger.debug("[OAuth] Found scopes in user_metadata: %s", scopes_str)
                             scopes = scopes_str.split(' ')
 
-                    print(f"💾 [OAuth] Storing tokens for {provider} with {len(scopes)} scopes")
+                    logger.debug("[OAuth] Storing tokens for %s with %d scopes", provider, len(scopes))
 
-                    await self._store_oauth_tokens(
+                    # Store in the background so the redirect isn't held up by the upsert
+                    self._run_in_background(self._store_oauth_tokens(
                         response.user.id,
                         provider,
                         response.session.provider_token,
                         response.session.provider_refresh_token,
                         scopes=scopes
-                    )
+                    ))
 
                 return {
                     "user": response.user,
@@ -344,29 +538,84 @@ class AuthService:
             scopes: List of granted OAuth scopes
         """
         try:
+            now_iso = utc_timestamp()
             token_data = {
                 "user_id": user_id,
                 "provider": provider,
-                "access_token": access_token,  # Should be encrypted in production
-                "refresh_token": refresh_token,  # Should be encrypted in production
+                "access_token": encrypt_token(access_token),
+                "refresh_token": encrypt_token(refresh_token),
                 "scopes": scopes or [],  # Store granted scopes
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
+                "created_at": now_iso,
+                "updated_at": now_iso
             }
 
-            print(f"💾 [OAuth] Storing token data: {{'provider': '{provider}', 'scopes': {scopes}}}")
+            logger.debug("[OAuth] Buffering token data for provider %s with scopes %s", provider, scopes)
 
-            # Upsert token data
-            self.supabase.table("user_oauth_tokens").upsert(
-                token_data,
-                on_conflict="user_id,provider"
-            ).execute()
+            # Latest tokens per user/provider win - one upsert can't touch a row twice
+            self._pending_oauth_tokens[(user_id, provider)] = token_data
 
-            print(f"✅ [OAuth] Tokens stored successfully for {provider}")
+            if (len(self._pending_oauth_tokens) >= self.OAUTH_TOKEN_BATCH_SIZE
+                    and time.monotonic() >= self._oauth_retry_at):
+                await self.flush_oauth_tokens()
+            elif self._oauth_flush_task is None:
+                delay = max(self.OAUTH_TOKEN_FLUSH_DELAY, self._oauth_retry_at - time.monotonic())
+                self._oauth_flush_task = asyncio.create_task(self._flush_oauth_tokens_later(delay))
 
         except Exception as e:
             # Log error but don't fail the auth flow
-            print(f"❌ Failed to store OAuth tokens: {str(e)}")
+            logger.warning("Failed to store OAuth tokens: %s", e)
+
+    async def _flush_oauth_tokens_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._oauth_flush_task = None
+        await self.flush_oauth_tokens()
+
+    async def flush_oauth_tokens(self) -> None:
+        """Upsert all buffered OAuth tokens in one request"""
+        async with self._oauth_flush_lock:
+            pending, self._pending_oauth_tokens = self._pending_oauth_tokens, {}
+            if not pending:
+                return
+
+            try:
+                client = await get_async_supabase()
+                await client.table("user_oauth_tokens").upsert(
+                    list(pending.values()),
+                    on_conflict="user_id,provider",
+                    returning=ReturnMethod.minimal
+                ).execute()
+
+            except Exception as e:
+                self._requeue_oauth_tokens(pending, e)
+                return
+
+            self._failed_oauth_flushes = 0
+            self._oauth_retry_at = 0.0
+            logger.info("[OAuth] Stored tokens for %d user/provider pair(s)", len(pending))
+
+    def _requeue_oauth_tokens(self, pending: Dict[Tuple[str, str], Dict[str, Any]], error: Exception) -> None:
+        self._failed_oauth_flushes += 1
+        if self._failed_oauth_flushes >= self.OAUTH_TOKEN_MAX_ATTEMPTS:
+            logger.error(
+                "Dropping OAuth tokens for %d user/provider pair(s) after %d failed upserts: %s",
+                len(pending), self._failed_oauth_flushes, error
+            )
+            self._failed_oauth_flushes = 0
+            self._oauth_retry_at = 0.0
+            return
+
+        logger.warning(
+            "Failed to store OAuth tokens for %d user/provider pair(s), retrying in %ss: %s",
+            len(pending), self.OAUTH_TOKEN_RETRY_DELAY, error
+        )
+        # Tokens buffered since the failed attempt are newer, so they win
+        for key, row in pending.items():
+            self._pending_oauth_tokens.setdefault(key, row)
+        self._oauth_retry_at = time.monotonic() + self.OAUTH_TOKEN_RETRY_DELAY
+        if self._oauth_flush_task is None:
+            self._oauth_flush_task = asyncio.create_task(
+                self._flush_oauth_tokens_later(self.OAUTH_TOKEN_RETRY_DELAY)
+            )
 
 
 # Singleton instance
@@ -3,10 +3,11 @@ Direct Google OAuth implementation with custom scopes
 Bypasses Supabase's OAuth provider to request Calendar and Gmail permissions
 """
 import os
-import httpx
+import orjson
 from typing import Dict, Any
 from urllib.parse import urlencode
 from app.core.config import settings
+from app.core.http import http_client
 
 
 class GoogleOAuthService:
@@ -29,10 +30,8 @@ class GoogleOAuthService:
         self.client_id = os.getenv("GOOGLE_CLIENT_ID")
         self.client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
         self.redirect_uri = "http://127.0.0.1:8000/api/auth/google/callback"
-
-    def get_authorization_url(self, state: str = None) -> str:
-        """Generate Google OAuth authorization URL with custom scopes"""
-        params = {
+        # Everything but state is fixed, so encode the URL once
+        self._authorization_url = f"{self.GOOGLE_AUTH_URL}?" + urlencode({
             "client_id": self.client_id,
             "redirect_uri": self.redirect_uri,
             "response_type": "code",
@@ -40,53 +39,51 @@ class GoogleOAuthService:
             "access_type": "offline",  # Get refresh token
             "prompt": "consent",  # Force consent screen
             "include_granted_scopes": "true"
-        }
+        })
 
+    def get_authorization_url(self, state: str = None) -> str:
+        """Generate Google OAuth authorization URL with custom scopes"""
         if state:
-            params["state"] = state
-
-        return f"{self.GOOGLE_AUTH_URL}?{urlencode(params)}"
+            return f"{self._authorization_url}&{urlencode({'state': state})}"
+        return self._authorization_url
 
     async def exchange_code_for_tokens(self, code: str) -> Dict[str, Any]:
         """Exchange authorization code for access and refresh tokens"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                self.GOOGLE_TOKEN_URL,
-                data={
-                    "code": code,
-                    "client_id": self.client_id,
-                    "client_secret": self.client_secret,
-                    "redirect_uri": self.redirect_uri,
-                    "grant_type": "authorization_code"
-                }
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await http_client.post(
+            self.GOOGLE_TOKEN_URL,
+            data={
+                "code": code,
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "redirect_uri": self.redirect_uri,
+                "grant_type": "authorization_code"
+            }
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
     async def get_user_info(self, access_token: str) -> Dict[str, Any]:
         """Get user profile info from Google"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                self.GOOGLE_USERINFO_URL,
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await http_client.get(
+            self.GOOGLE_USERINFO_URL,
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
     async def refresh_access_token(self, refresh_token: str) -> Dict[str, Any]:
         """Refresh an expired access token"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                self.GOOGLE_TOKEN_URL,
-                data={
-                    "client_id": self.client_id,
-                    "client_secret": self.client_secret,
-                    "refresh_token": refresh_token,
-                    "grant_type": "refresh_token"
-                }
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await http_client.post(
+            self.GOOGLE_TOKEN_URL,
+            data={
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "refresh_token": refresh_token,
+                "grant_type": "refresh_token"
+            }
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
 
 # Global instance
@@ -1,40 +1,125 @@
 import asyncio
+import logging
+import re
+import time
 import uuid
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from functools import lru_cache
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any
-import traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
-from app.core.database import supabase
+import orjson
+from postgrest import ReturnMethod
+
+from app.core.database import execute_rpc, get_async_supabase
+
+logger = logging.getLogger(__name__)
+
+# Date, optionally followed by a time - anything else can't be ISO-8601
+_ISO_PREFIX_RE = re.compile(r"\d{4}-\d{2}-\d{2}(?:$|[T ])")
+
+# Fields stored in keystroke_sequences.sequence_data, with their empty defaults.
+# The defaults are shared and only ever serialized, never mutated
+_SEQUENCE_DATA_DEFAULTS = {
+    "keys": [],
+    "timings": [],
+    "modifiers": [],
+    "states": [],
+    "down_keys": [],
+    "patterns": {},
+    "metadata": {},
+    "context_data": {}
+}
+
+# Average keystroke interval (ms) upper bounds for each typing speed label
+_SPEED_THRESHOLDS = (100, 200, 400)
+_SPEED_LABELS = ("fast", "moderate", "slow", "very_slow")
+
+# Apps where vim-style navigation suggestions apply
+_CODING_APP_RE = re.compile(r"vim|code|terminal")
+
+_VIM_NAVIGATION_SUGGESTION = "Consider using vim navigation commands like '5j' instead of pressing arrow keys repeatedly"
+
+NAV_KEYS = frozenset({"ArrowUp", "ArrowDown", "ArrowLeft", "ArrowRight", "j", "k", "h", "l"})
+VERTICAL_NAV_PATTERNS = frozenset({"vertical_down", "vertical_up"})
+PRODUCTIVITY_SHORTCUTS = frozenset({
+    "cmd+c", "cmd+v", "cmd+x", "cmd+z", "cmd+s", "cmd+f", "cmd+a",
+    "ctrl+c", "ctrl+v", "ctrl+x", "ctrl+z", "ctrl+s", "ctrl+f", "ctrl+a"
+})
+
+
+@lru_cache(maxsize=4096)
+def _parse_iso_cached(value: str) -> Optional[str]:
+    """Return value if it is an ISO-8601 timestamp, else None (memoized per string)"""
+    try:
+        datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return value
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _epoch_to_iso(timestamp: float) -> Optional[str]:
+    """Convert epoch seconds or milliseconds to ISO-8601 (memoized per value)"""
+    if timestamp > 1e12:
+        timestamp = timestamp / 1000
+    try:
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+    except (ValueError, OSError, OverflowError):
+        return None
+
+
+@lru_cache(maxsize=128)
+def _shortcut_suggestion(app_name: str) -> str:
+    """Shortcut recommendation text, built once per app"""
+    return f"Consider learning keyboard shortcuts for {app_name} to improve efficiency"
 
 
 class KeystrokeAnalysisService:
-    def __init__(self):
-        self.analysis_cache = {}
+    # Sequence and analysis rows are buffered and written as multi-row inserts
+    # once INSERT_FLUSH_DELAY seconds pass or INSERT_BATCH_SIZE rows are pending
+    INSERT_FLUSH_DELAY = 0.2
+    INSERT_BATCH_SIZE = 50
+    # Failed batches go back in the buffer and are retried after INSERT_RETRY_DELAY
+    # seconds, then dropped once INSERT_MAX_ATTEMPTS flushes in a row have failed
+    INSERT_RETRY_DELAY = 5
+    INSERT_MAX_ATTEMPTS = 3
+
+    # Dashboard reads are served from memory for READ_CACHE_TTL seconds and
+    # dropped for a user as soon as their new rows are written
+    READ_CACHE_TTL = 5
+    READ_CACHE_MAX_SIZE = 1024
 
-    def _convert_timestamp(self, timestamp_value):
+    def __init__(self):
+        self._pending_sequences: List[Dict[str, Any]] = []
+        self._pending_analyses: List[Dict[str, Any]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._failed_flushes = 0
+        self._retry_at = 0.0
+        self._read_cache: "OrderedDict[Tuple[Any, ...], Tuple[bytes, float]]" = OrderedDict()
+        self._read_locks: Dict[Tuple[Any, ...], List[Any]] = {}
+
+    def _convert_timestamp(self, timestamp_value, now_iso: Optional[str] = None):
         if not timestamp_value:
-            return datetime.now(timezone.utc).isoformat()
+            return now_iso or datetime.now(timezone.utc).isoformat()
 
-        if isinstance(timestamp_value, str):
-            try:
-                datetime.fromisoformat(timestamp_value.replace('Z', '+00:00'))
-                return timestamp_value
-            except:
-                pass
+        # Epoch strings skip the ISO parse (and its exception) via the prefix check
+        if (isinstance(timestamp_value, str) and _ISO_PREFIX_RE.match(timestamp_value)
+                and _parse_iso_cached(timestamp_value)):
+            return timestamp_value
 
         if isinstance(timestamp_value, (int, float, str)):
             try:
-                timestamp_float = float(timestamp_value)
-
-                if timestamp_float > 1e12:
-                    timestamp_float = timestamp_float / 1000
-
-                dt = datetime.fromtimestamp(timestamp_float, tz=timezone.utc)
-                return dt.isoformat()
-            except (ValueError, OSError):
+                # Keyed on the float so 1700000000, 1700000000.0 and "1700000000" share an entry
+                converted = _epoch_to_iso(float(timestamp_value))
+                if converted:
+                    return converted
+            except ValueError:
                 pass
 
-        return datetime.now(timezone.utc).isoformat()
+        return now_iso or datetime.now(timezone.utc).isoformat()
 
     async def process_keystroke_sequence(
         self,
@@ -43,11 +128,23 @@ class KeystrokeAnalysisService:
         session_context: Dict[str, Any]
     ) -> Dict[str, Any]:
         try:
-            stored_sequence = await self._store_keystroke_sequence(user_id, sequence_data, session_context)
+            patterns = sequence_data.get("patterns") or {}
+            metadata = sequence_data.get("metadata") or {}
+            app_name = (sequence_data.get("context_data") or {}).get("primary_app", "Unknown")
+            # One timestamp for every row written for this sequence
+            now_iso = datetime.now(timezone.utc).isoformat()
 
-            pattern_analysis = await self._analyze_keystroke_patterns(sequence_data)
+            # Only storing the analysis needs the stored sequence, so analyze while it's written
+            store_task = asyncio.create_task(
+                self._store_keystroke_sequence(user_id, sequence_data, session_context, app_name, now_iso)
+            )
 
-            efficiency_analysis = await self._analyze_efficiency_opportunities(sequence_data, session_context)
+            pattern_analysis, efficiency_analysis = await asyncio.gather(
+                self._analyze_keystroke_patterns(patterns, metadata),
+                self._analyze_efficiency_opportunities(sequence_data, patterns, app_name)
+            )
+
+            stored_sequence = await store_task
 
             analysis_results = {
                 "sequence_id": stored_sequence.get("id"),
@@ -58,12 +155,12 @@ class KeystrokeAnalysisService:
                 "recommendations": efficiency_analysis.get("recommendations", [])
             }
 
-            await self._store_analysis_results(user_id, stored_sequence.get("id"), analysis_results)
+            await self._store_analysis_results(user_id, stored_sequence.get("id"), analysis_results, now_iso)
 
             return analysis_results
 
         except Exception as e:
-            traceback.print_exc()
+            logger.exception("Failed to process keystroke sequence for user %s", user_id)
             return {
                 "sequence_id": None,
                 "patterns_detected": 0,
@@ -75,51 +172,54 @@ class KeystrokeAnalysisService:
         self,
         user_id: str,
         sequence_data: Dict[str, Any],
-        session_context: Dict[str, Any]
+        session_context: Dict[str, Any],
+        app_name: str,
+        now_iso: str
     ) -> Dict[str, Any]:
         try:
             sequence_record = {
                 "id": str(uuid.uuid4()),
                 "user_id": user_id,
-                "sequence_start": self._convert_timestamp(sequence_data.get("sequence_start")),
+                "sequence_start": self._convert_timestamp(sequence_data.get("sequence_start"), now_iso),
                 "sequence_duration": sequence_data.get("sequence_duration"),
                 "keystroke_count": sequence_data.get("keystroke_count"),
                 "sequence_data": {
-                    "keys": sequence_data.get("keys", []),
-                    "timings": sequence_data.get("timings", []),
-                    "modifiers": sequence_data.get("modifiers", []),
-                    "states": sequence_data.get("states", []),
-                    "down_keys": sequence_data.get("down_keys", []),
-                    "patterns": sequence_data.get("patterns", {}),
-                    "metadata": sequence_data.get("metadata", {}),
-                    "context_data": sequence_data.get("context_data", {})
+                    key: sequence_data.get(key, default)
+                    for key, default in _SEQUENCE_DATA_DEFAULTS.items()
                 },
-                "app_context": sequence_data.get("context_data", {}).get("primary_app", "Unknown"),
+                "app_context": app_name,
                 "session_context": session_context,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "created_at": now_iso,
+                "updated_at": now_iso
             }
 
-            result = supabase.table("keystroke_sequences").insert(sequence_record).execute()
+            # The id is generated here, so the record can be returned before it's written
+            self._pending_sequences.append(sequence_record)
+            await self._schedule_flush()
 
-            return result.data[0] if result.data else sequence_record
+            return sequence_record
 
         except Exception as e:
             raise
 
-    async def _analyze_keystroke_patterns(self, sequence_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _analyze_keystroke_patterns(
+        self,
+        patterns: Dict[str, Any],
+        metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
         try:
-            keys = sequence_data.get("keys", [])
-            timings = sequence_data.get("timings", [])
-            modifiers = sequence_data.get("modifiers", [])
-            patterns = sequence_data.get("patterns", {})
+            # One pass over the repetitive sequences serves both analyses that count them
+            repetitive_sequences = patterns.get("repetitive_sequences", [])
+            high_repetition_count, navigation_repetition_count = self._scan_repetitive(repetitive_sequences)
 
             analysis = {
-                "repetitive_patterns": self._analyze_repetitive_patterns(patterns.get("repetitive_sequences", [])),
+                "repetitive_patterns": self._analyze_repetitive_patterns(
+                    repetitive_sequences, high_repetition_count, navigation_repetition_count
+                ),
                 "timing_analysis": self._analyze_timing_patterns(patterns.get("timing_patterns", {})),
                 "navigation_analysis": self._analyze_navigation_patterns(patterns.get("navigation_sequences", [])),
                 "shortcut_analysis": self._analyze_shortcut_patterns(patterns.get("shortcut_sequences", [])),
-                "efficiency_indicators": self._calculate_efficiency_indicators(sequence_data),
+                "efficiency_indicators": self._calculate_efficiency_indicators(metadata, high_repetition_count),
                 "significant_patterns": []
             }
 
@@ -130,20 +230,32 @@ class KeystrokeAnalysisService:
         except Exception as e:
             return {"error": str(e)}
 
-    def _analyze_repetitive_patterns(self, repetitive_sequences: List[Dict]) -> Dict[str, Any]:
+    def _scan_repetitive(self, repetitive_sequences: List[Dict]) -> Tuple[int, int]:
+        high_repetition_count = 0
+        navigation_repetition_count = 0
+        for seq in repetitive_sequences:
+            if seq.get("repetitions", 0) >= 5:
+                high_repetition_count += 1
+            if seq.get("key") in NAV_KEYS:
+                navigation_repetition_count += 1
+
+        return high_repetition_count, navigation_repetition_count
+
+    def _analyze_repetitive_patterns(
+        self,
+        repetitive_sequences: List[Dict],
+        high_repetition_count: int,
+        navigation_repetition_count: int
+    ) -> Dict[str, Any]:
         if not repetitive_sequences:
             return {"total_repetitive_sequences": 0}
 
-        high_repetition_sequences = [seq for seq in repetitive_sequences if seq.get("repetitions", 0) >= 5]
-        navigation_repetitions = [seq for seq in repetitive_sequences
-                                if seq.get("key") in ["ArrowUp", "ArrowDown", "ArrowLeft", "ArrowRight", "j", "k", "h", "l"]]
-
         return {
             "total_repetitive_sequences": len(repetitive_sequences),
-            "high_repetition_sequences": len(high_repetition_sequences),
-            "navigation_repetitions": len(navigation_repetitions),
+            "high_repetition_sequences": high_repetition_count,
+            "navigation_repetitions": navigation_repetition_count,
             "repetition_details": repetitive_sequences[:5],
-            "potential_inefficiencies": len(high_repetition_sequences) > 0
+            "potential_inefficiencies": high_repetition_count > 0
         }
 
     def _analyze_timing_patterns(self, timing_patterns: Dict[str, Any]) -> Dict[str, Any]:
@@ -176,18 +288,18 @@ class KeystrokeAnalysisService:
             return {"navigation_efficiency": "no_data"}
 
         total_sequences = len(navigation_sequences)
-        long_sequences = [seq for seq in navigation_sequences if len(seq.get("keys", [])) >= 5]
+        long_count = sum(1 for seq in navigation_sequences if len(seq.get("keys", [])) >= 5)
 
-        repetitive_navigation = [seq for seq in navigation_sequences
-                               if seq.get("pattern_type") in ["vertical_down", "vertical_up"]
-                               and len(seq.get("keys", [])) >= 5]
+        repetitive_navigation_count = sum(1 for seq in navigation_sequences
+                                          if seq.get("pattern_type") in VERTICAL_NAV_PATTERNS
+                                          and len(seq.get("keys", [])) >= 5)
 
         return {
             "total_navigation_sequences": total_sequences,
-            "long_navigation_sequences": len(long_sequences),
-            "repetitive_navigation_sequences": len(repetitive_navigation),
-            "potential_vim_opportunities": len(repetitive_navigation) > 0,
-            "navigation_efficiency_score": max(0, 1.0 - (len(long_sequences) / max(total_sequences, 1)))
+            "long_navigation_sequences": long_count,
+            "repetitive_navigation_sequences": repetitive_navigation_count,
+            "potential_vim_opportunities": repetitive_navigation_count > 0,
+            "navigation_efficiency_score": max(0, 1.0 - (long_count / max(total_sequences, 1)))
         }
 
     def _analyze_shortcut_patterns(self, shortcut_sequences: List[Dict]) -> Dict[str, Any]:
@@ -195,27 +307,19 @@ class KeystrokeAnalysisService:
             return {"shortcut_usage": "minimal"}
 
         shortcuts = [seq.get("shortcut", "") for seq in shortcut_sequences]
-        unique_shortcuts = set(shortcuts)
-
-        productivity_shortcuts = [
-            "cmd+c", "cmd+v", "cmd+x", "cmd+z", "cmd+s", "cmd+f", "cmd+a",
-            "ctrl+c", "ctrl+v", "ctrl+x", "ctrl+z", "ctrl+s", "ctrl+f", "ctrl+a"
-        ]
+        shortcut_counts = Counter(shortcuts)
 
-        used_productivity_shortcuts = [s for s in shortcuts if s.lower() in productivity_shortcuts]
+        productivity_shortcuts_used = sum(1 for s in shortcuts if s.lower() in PRODUCTIVITY_SHORTCUTS)
 
         return {
             "total_shortcuts": len(shortcuts),
-            "unique_shortcuts": len(unique_shortcuts),
-            "productivity_shortcuts_used": len(used_productivity_shortcuts),
-            "shortcut_diversity": len(unique_shortcuts) / max(len(shortcuts), 1),
-            "most_used_shortcuts": list(unique_shortcuts)[:5]
+            "unique_shortcuts": len(shortcut_counts),
+            "productivity_shortcuts_used": productivity_shortcuts_used,
+            "shortcut_diversity": len(shortcut_counts) / max(len(shortcuts), 1),
+            "most_used_shortcuts": [shortcut for shortcut, _ in shortcut_counts.most_common(5)]
         }
 
-    def _calculate_efficiency_indicators(self, sequence_data: Dict[str, Any]) -> Dict[str, Any]:
-        metadata = sequence_data.get("metadata", {})
-        patterns = sequence_data.get("patterns", {})
-
+    def _calculate_efficiency_indicators(self, metadata: Dict[str, Any], high_repetition_count: int) -> Dict[str, Any]:
         total_keystrokes = metadata.get("total_keystrokes", 0)
         shortcuts_used = metadata.get("shortcuts_used", 0)
         navigation_keys = metadata.get("navigation_keys_used", 0)
@@ -223,9 +327,6 @@ class KeystrokeAnalysisService:
         shortcut_ratio = shortcuts_used / max(total_keystrokes, 1)
         navigation_ratio = navigation_keys / max(total_keystrokes, 1)
 
-        repetitive_sequences = patterns.get("repetitive_sequences", [])
-        high_repetition_count = len([seq for seq in repetitive_sequences if seq.get("repetitions", 0) >= 5])
-
         return {
             "shortcut_usage_ratio": shortcut_ratio,
             "navigation_usage_ratio": navigation_ratio,
@@ -284,37 +385,27 @@ class KeystrokeAnalysisService:
         return significant_patterns
 
     def _categorize_typing_speed(self, avg_interval: float) -> str:
-        if avg_interval < 100:
-            return "fast"
-        elif avg_interval < 200:
-            return "moderate"
-        elif avg_interval < 400:
-            return "slow"
-        else:
-            return "very_slow"
+        return _SPEED_LABELS[bisect_right(_SPEED_THRESHOLDS, avg_interval)]
 
     async def _analyze_efficiency_opportunities(
         self,
         sequence_data: Dict[str, Any],
-        session_context: Dict[str, Any]
+        patterns: Dict[str, Any],
+        app_name: str
     ) -> Dict[str, Any]:
         try:
-            app_name = sequence_data.get("context_data", {}).get("primary_app", "Unknown")
-            patterns = sequence_data.get("patterns", {})
-
             recommendations = []
             efficiency_score = 0.5
 
             navigation_sequences = patterns.get("navigation_sequences", [])
             repetitive_nav = [seq for seq in navigation_sequences
-                            if seq.get("pattern_type") in ["vertical_down", "vertical_up"]
+                            if seq.get("pattern_type") in VERTICAL_NAV_PATTERNS
                             and len(seq.get("keys", [])) >= 5]
 
-            if repetitive_nav and any("vim" in app_name.lower() or "code" in app_name.lower()
-                                   or "terminal" in app_name.lower() for app_name in [app_name]):
+            if repetitive_nav and _CODING_APP_RE.search(app_name.lower()):
                 recommendations.append({
                     "type": "navigation_efficiency",
-                    "suggestion": "Consider using vim navigation commands like '5j' instead of pressing arrow keys repeatedly",
+                    "suggestion": _VIM_NAVIGATION_SUGGESTION,
                     "confidence": 0.8,
                     "context": app_name
                 })
@@ -324,7 +415,7 @@ class KeystrokeAnalysisService:
             if len(shortcut_sequences) < 2 and sequence_data.get("keystroke_count", 0) > 20:
                 recommendations.append({
                     "type": "shortcut_opportunity",
-                    "suggestion": f"Consider learning keyboard shortcuts for {app_name} to improve efficiency",
+                    "suggestion": _shortcut_suggestion(app_name),
                     "confidence": 0.6,
                     "context": app_name
                 })
@@ -350,7 +441,8 @@ class KeystrokeAnalysisService:
         self,
         user_id: str,
         sequence_id: str,
-        analysis_results: Dict[str, Any]
+        analysis_results: Dict[str, Any],
+        now_iso: str
     ) -> None:
         try:
             if not sequence_id:
@@ -361,26 +453,152 @@ class KeystrokeAnalysisService:
                 "user_id": user_id,
                 "sequence_id": sequence_id,
                 "analysis_data": analysis_results,
-                "created_at": datetime.now(timezone.utc).isoformat()
+                "created_at": now_iso
             }
 
-            result = supabase.table("keystroke_analysis").insert(analysis_record).execute()
+            self._pending_analyses.append(analysis_record)
+            await self._schedule_flush()
 
         except Exception as e:
             pass
 
+    async def _schedule_flush(self) -> None:
+        pending = len(self._pending_sequences) + len(self._pending_analyses)
+        if pending >= self.INSERT_BATCH_SIZE and time.monotonic() >= self._retry_at:
+            await self.flush_inserts()
+        elif self._flush_task is None:
+            delay = max(self.INSERT_FLUSH_DELAY, self._retry_at - time.monotonic())
+            self._flush_task = asyncio.create_task(self._flush_inserts_later(delay))
+
+    async def _flush_inserts_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        await self.flush_inserts()
+
+    async def flush_inserts(self) -> None:
+        # One flush at a time, so a batch's analyses never reach the database
+        # before the sequences they reference from an earlier batch
+        async with self._flush_lock:
+            sequences, self._pending_sequences = self._pending_sequences, []
+            analyses, self._pending_analyses = self._pending_analyses, []
+            if not sequences and not analyses:
+                return
+
+            sequences_written = False
+            try:
+                client = await get_async_supabase()
+
+                # Sequences first - analyses reference them by sequence_id. Ids are
+                # generated here, so the rows needn't be sent back, and a retried
+                # batch skips any rows an earlier attempt already wrote
+                if sequences:
+                    await client.table("keystroke_sequences").upsert(
+                        sequences, ignore_duplicates=True, returning=ReturnMethod.minimal
+                    ).execute()
+                    sequences_written = True
+                if analyses:
+                    await client.table("keystroke_analysis").upsert(
+                        analyses, ignore_duplicates=True, returning=ReturnMethod.minimal
+                    ).execute()
+
+            except Exception as e:
+                if sequences_written:
+                    self._invalidate_reads({record["user_id"] for record in sequences})
+                    sequences = []
+                self._requeue_inserts(sequences, analyses, e)
+                return
+
+            self._failed_flushes = 0
+            self._retry_at = 0.0
+            self._invalidate_reads({record["user_id"] for record in sequences} |
+                                   {record["user_id"] for record in analyses})
+
+    def _requeue_inserts(
+        self,
+        sequences: List[Dict[str, Any]],
+        analyses: List[Dict[str, Any]],
+        error: Exception
+    ) -> None:
+        self._failed_flushes += 1
+        if self._failed_flushes >= self.INSERT_MAX_ATTEMPTS:
+            logger.error(
+                "Dropping %d keystroke sequences and %d analyses after %d failed inserts: %s",
+                len(sequences), len(analyses), self._failed_flushes, error
+            )
+            self._failed_flushes = 0
+            self._retry_at = 0.0
+            return
+
+        logger.warning(
+            "Failed to insert %d keystroke sequences and %d analyses, retrying in %ss: %s",
+            len(sequences), len(analyses), self.INSERT_RETRY_DELAY, error
+        )
+        # Ahead of rows buffered since, so sequences still precede their analyses
+        self._pending_sequences[:0] = sequences
+        self._pending_analyses[:0] = analyses
+        self._retry_at = time.monotonic() + self.INSERT_RETRY_DELAY
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_inserts_later(self.INSERT_RETRY_DELAY))
+
+    async def _cached_read(self, key: Tuple[Any, ...], load: Callable[[], Awaitable[Any]]) -> Any:
+        """Return load()'s result for key, sharing one query among concurrent callers"""
+        cached = self._get_cached_read(key)
+        if cached is not None:
+            return cached
+
+        # [lock, callers using it]; the lock is dropped once nobody holds or awaits it
+        entry = self._read_locks.get(key)
+        if entry is None:
+            entry = self._read_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                # Another caller may have filled the entry while this one waited
+                cached = self._get_cached_read(key)
+                if cached is not None:
+                    return cached
+
+                value = await load()
+                # Stored serialized so every caller gets its own copy to modify
+                self._read_cache[key] = (orjson.dumps(value), time.monotonic() + self.READ_CACHE_TTL)
+                self._read_cache.move_to_end(key)
+                if len(self._read_cache) > self.READ_CACHE_MAX_SIZE:
+                    self._read_cache.popitem(last=False)
+                return value
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._read_locks[key]
+
+    def _get_cached_read(self, key: Tuple[Any, ...]) -> Any:
+        cached = self._read_cache.get(key)
+        if cached is None or cached[1] <= time.monotonic():
+            return None
+        return orjson.loads(cached[0])
+
+    def _invalidate_reads(self, user_ids: set) -> None:
+        if not user_ids or not self._read_cache:
+            return
+        # Keys are (kind, user_id, ...)
+        for key in [key for key in self._read_cache if key[1] in user_ids]:
+            del self._read_cache[key]
+
     async def get_user_keystroke_patterns(
         self,
         user_id: str,
         limit: int = 10
     ) -> List[Dict[str, Any]]:
-        try:
-            result = supabase.table("keystroke_sequences").select("*").eq(
+        async def load() -> List[Dict[str, Any]]:
+            client = await get_async_supabase()
+            result = await client.table("keystroke_sequences").select("*").eq(
                 "user_id", user_id
             ).order("created_at", desc=True).limit(limit).execute()
 
             return result.data if result.data else []
 
+        try:
+            return await self._cached_read(("patterns", user_id, limit), load)
+
         except Exception as e:
             return []
 
@@ -390,33 +608,35 @@ class KeystrokeAnalysisService:
         app_name: Optional[str] = None
     ) -> Dict[str, Any]:
         try:
-            query = supabase.table("keystroke_analysis").select("*").eq("user_id", user_id)
-
-            if app_name:
-                pass
-
-            result = query.order("created_at", desc=True).limit(20).execute()
+            return await self._cached_read(
+                ("insights", user_id, app_name),
+                lambda: self._load_efficiency_insights(user_id, app_name)
+            )
 
-            if not result.data:
-                return {"insights": "No keystroke data available"}
-
-            analyses = result.data
-            total_analyses = len(analyses)
-            avg_efficiency = sum(a.get("analysis_data", {}).get("efficiency_score", 0.5) for a in analyses) / total_analyses
-
-            common_recommendations = {}
-            for analysis in analyses:
-                recommendations = analysis.get("analysis_data", {}).get("recommendations", [])
-                for rec in recommendations:
-                    rec_type = rec.get("type", "unknown")
-                    common_recommendations[rec_type] = common_recommendations.get(rec_type, 0) + 1
+        except Exception as e:
+            return {"error": str(e)}
 
-            return {
-                "total_analyses": total_analyses,
-                "average_efficiency_score": avg_efficiency,
-                "common_improvement_areas": common_recommendations,
-                "recent_insights": [a.get("analysis_data", {}) for a in analyses[:5]]
+    async def _load_efficiency_insights(
+        self,
+        user_id: str,
+        app_name: Optional[str]
+    ) -> Dict[str, Any]:
+        # Aggregated over the latest 20 analyses in the database (migration 030)
+        rows = await execute_rpc(
+            "get_keystroke_efficiency_insights",
+            {
+                "p_user_id": user_id,
+                "p_app_name": app_name or None
             }
+        )
 
-        except Exception as e:
-            return {"error": str(e)}
\ No newline at end of file
+        insights = rows[0] if rows else None
+        if not insights or not insights["total_analyses"]:
+            return {"insights": "No keystroke data available"}
+
+        return {
+            "total_analyses": insights["total_analyses"],
+            "average_efficiency_score": insights["average_efficiency_score"],
+            "common_improvement_areas": insights["common_improvement_areas"],
+            "recent_insights": insights["recent_insights"]
+        }
\ No newline at end of file
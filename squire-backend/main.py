@@ -11,8 +11,11 @@ load_dotenv()
 
 from app.routers import ai, activity, websocket, vision, llm, auth, actions, tools
 from app.services.websocket_manager import ws_manager
+from app.services.app_session_service import AppSessionService
+from app.services.auth_service import auth_service
 from app.core.config import settings
-from app.core.database import supabase
+from app.core.database import supabase, get_async_supabase, close_async_supabase
+from app.core.http import close_http_client
 import socketio
 
 
@@ -21,6 +24,10 @@ async def lifespan(app: FastAPI):
     print("🚀 Starting Squire Backend API...")
     print("🔌 WebSocket Manager ready for connections")
 
+    # Open the shared async Supabase connection pool up front
+    await get_async_supabase()
+    print("✅ Async Supabase client ready")
+
     # Start OCR job manager
     print("🔄 Starting OCR job manager...")
     await ai.ocr_job_manager.start()
@@ -31,6 +38,14 @@ async def lifespan(app: FastAPI):
     # Stop OCR job manager
     print("🛑 Stopping OCR job manager...")
     await ai.ocr_job_manager.stop()
+
+    # Write out any buffered app session heartbeats, OAuth tokens and keystroke rows
+    await AppSessionService.flush_heartbeats()
+    await auth_service.flush_oauth_tokens()
+    await ai.keystroke_analysis_service.flush_inserts()
+
+    await close_async_supabase()
+    await close_http_client()
     print("🛑 Shutting down Squire Backend API...")
 
 
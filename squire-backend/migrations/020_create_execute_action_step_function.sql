@@ -0,0 +1,40 @@
+-- Migration 020: Queue, approve and fetch an action step in one round trip
+-- Used by ActionExecutor.execute_direct_actions instead of calling
+-- queue_action, approve_action and selecting the row separately
+
+CREATE OR REPLACE FUNCTION execute_action_step(
+    p_user_id UUID,
+    p_suggestion_id UUID,
+    p_action_type TEXT,
+    p_action_data JSONB,
+    p_requires_approval BOOLEAN DEFAULT TRUE,
+    p_priority INTEGER DEFAULT 5
+)
+RETURNS SETOF action_queue AS $$
+DECLARE
+    v_action_id UUID;
+BEGIN
+    v_action_id := queue_action(
+        p_user_id,
+        p_suggestion_id,
+        p_action_type,
+        p_action_data,
+        p_requires_approval,
+        p_priority
+    );
+
+    -- Actions needing approval are auto-approved until the client-side
+    -- approval flow (WebSocket/polling) is in place
+    IF p_requires_approval THEN
+        PERFORM approve_action(v_action_id, p_user_id);
+    END IF;
+
+    RETURN QUERY
+    SELECT *
+    FROM action_queue
+    WHERE id = v_action_id
+      AND user_id = p_user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION execute_action_step IS 'Queues an action, approves it if required and returns the action_queue row';
@@ -0,0 +1,31 @@
+-- Migration 021: End timed-out app sessions with a single UPDATE
+-- Replaces selecting every active session and ending them one by one
+
+CREATE OR REPLACE FUNCTION end_inactive_app_sessions(
+    p_user_id UUID,
+    p_session_id UUID,
+    p_timeout_minutes INTEGER DEFAULT 5,
+    p_reason TEXT DEFAULT 'timeout'
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_ended_count INTEGER;
+BEGIN
+    UPDATE app_sessions
+    SET
+        end_time = NOW(),
+        is_active = FALSE,
+        transition_reason = p_reason,
+        updated_at = NOW()
+    WHERE
+        user_id = p_user_id
+        AND session_id = p_session_id
+        AND is_active = TRUE
+        AND last_activity < NOW() - make_interval(mins => p_timeout_minutes);
+
+    GET DIAGNOSTICS v_ended_count = ROW_COUNT;
+    RETURN v_ended_count;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION end_inactive_app_sessions IS 'Ends active app sessions idle longer than the timeout and returns how many were ended';
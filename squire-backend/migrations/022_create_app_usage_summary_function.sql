@@ -0,0 +1,26 @@
+-- Migration 022: Aggregate per-app usage for a day in the database
+-- Replaces fetching every app_session for a user and filtering by date in Python
+
+CREATE OR REPLACE FUNCTION get_app_usage_summary(
+    p_user_id UUID,
+    p_date DATE
+)
+RETURNS TABLE(
+    app_name TEXT,
+    total_minutes BIGINT
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        s.app_name,
+        SUM(GREATEST(1, COALESCE(s.duration_seconds, 0) / 60))::BIGINT AS total_minutes
+    FROM app_sessions s
+    WHERE s.user_id = p_user_id
+      AND s.start_time >= p_date
+      AND s.start_time < p_date + 1
+    GROUP BY s.app_name
+    ORDER BY total_minutes DESC;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION get_app_usage_summary IS 'Minutes spent per app on a given day, each session counting at least one minute';
@@ -0,0 +1,85 @@
+-- Migration 023: Create-or-update the active app session in one statement
+-- Replaces SELECT-then-INSERT/UPDATE, which took two round trips and let
+-- concurrent heartbeats create duplicate active sessions
+
+-- Close duplicate active sessions so the unique index can be built,
+-- keeping the most recently active row for each (user, session, app)
+UPDATE app_sessions s
+SET
+    is_active = FALSE,
+    end_time = COALESCE(s.end_time, NOW()),
+    transition_reason = 'duplicate'
+WHERE s.is_active
+  AND EXISTS (
+      SELECT 1
+      FROM app_sessions d
+      WHERE d.user_id = s.user_id
+        AND d.session_id = s.session_id
+        AND d.app_name = s.app_name
+        AND d.is_active
+        AND (d.last_activity > s.last_activity
+             OR (d.last_activity = s.last_activity AND d.id > s.id))
+  );
+
+-- At most one active session per user/session/app
+CREATE UNIQUE INDEX IF NOT EXISTS idx_app_sessions_active_unique
+ON app_sessions(user_id, session_id, app_name)
+WHERE is_active;
+
+CREATE OR REPLACE FUNCTION upsert_app_session(
+    p_user_id UUID,
+    p_session_id UUID,
+    p_app_name TEXT,
+    p_window_title TEXT DEFAULT '',
+    p_bundle_id TEXT DEFAULT '',
+    p_context_type TEXT DEFAULT '',
+    p_domain TEXT DEFAULT '',
+    p_activity_summary TEXT DEFAULT ''
+)
+RETURNS UUID AS $$
+DECLARE
+    v_app_session_id UUID;
+BEGIN
+    INSERT INTO app_sessions (
+        user_id,
+        session_id,
+        app_name,
+        window_title,
+        bundle_id,
+        context_type,
+        domain,
+        activity_summary,
+        start_time,
+        last_activity,
+        is_active
+    )
+    VALUES (
+        p_user_id,
+        p_session_id,
+        p_app_name,
+        p_window_title,
+        p_bundle_id,
+        COALESCE(NULLIF(p_context_type, ''), 'general'),
+        COALESCE(NULLIF(p_domain, ''), 'general'),
+        p_activity_summary,
+        NOW(),
+        NOW(),
+        TRUE
+    )
+    ON CONFLICT (user_id, session_id, app_name) WHERE is_active
+    DO UPDATE SET
+        window_title = EXCLUDED.window_title,
+        bundle_id = EXCLUDED.bundle_id,
+        last_activity = NOW(),
+        updated_at = NOW(),
+        -- Optional context only overwrites when provided
+        context_type = COALESCE(NULLIF(p_context_type, ''), app_sessions.context_type),
+        domain = COALESCE(NULLIF(p_domain, ''), app_sessions.domain),
+        activity_summary = COALESCE(NULLIF(p_activity_summary, ''), app_sessions.activity_summary)
+    RETURNING id INTO v_app_session_id;
+
+    RETURN v_app_session_id;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION upsert_app_session IS 'Inserts the active app session or bumps the existing one, returning its id';
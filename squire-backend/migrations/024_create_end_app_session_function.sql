@@ -0,0 +1,22 @@
+-- Migration 024: End an app session using the database clock
+-- end_time comes from NOW() instead of a client-formatted timestamp;
+-- updated_at and duration_seconds are filled in by app_session_duration_trigger
+
+CREATE OR REPLACE FUNCTION end_app_session(
+    p_app_session_id UUID,
+    p_reason TEXT DEFAULT 'manual'
+)
+RETURNS BOOLEAN AS $$
+BEGIN
+    UPDATE app_sessions
+    SET
+        end_time = NOW(),
+        is_active = FALSE,
+        transition_reason = p_reason
+    WHERE id = p_app_session_id;
+
+    RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION end_app_session IS 'Marks an app session as ended at the current database time';
@@ -0,0 +1,38 @@
+-- Migration 025: Batch variant of upsert_app_session for coalesced heartbeats
+-- Applies several buffered app session updates in one round trip
+
+CREATE OR REPLACE FUNCTION upsert_app_sessions(p_sessions JSONB)
+RETURNS TABLE(app_session_id UUID) AS $$
+DECLARE
+    r RECORD;
+BEGIN
+    -- Rows are returned in input order so callers can zip them back
+    FOR r IN
+        SELECT *
+        FROM jsonb_to_recordset(p_sessions) AS s(
+            user_id UUID,
+            session_id UUID,
+            app_name TEXT,
+            window_title TEXT,
+            bundle_id TEXT,
+            context_type TEXT,
+            domain TEXT,
+            activity_summary TEXT
+        )
+    LOOP
+        app_session_id := upsert_app_session(
+            r.user_id,
+            r.session_id,
+            r.app_name,
+            r.window_title,
+            r.bundle_id,
+            r.context_type,
+            r.domain,
+            r.activity_summary
+        );
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION upsert_app_sessions IS 'Applies upsert_app_session to each element of a JSON array, returning the ids in order';
@@ -0,0 +1,6 @@
+-- Migration 026: Index app_sessions by user and start time
+-- Lets get_app_usage_summary's per-day start_time range (and other per-user
+-- time-ordered reads) use an index instead of scanning the user's history
+
+CREATE INDEX IF NOT EXISTS idx_app_sessions_user_start_time
+ON app_sessions(user_id, start_time DESC);
@@ -0,0 +1,11 @@
+-- Migration 027: Serve get_active_app_sessions from the active-row partial index
+-- The index only holds active rows, so it stays small regardless of history.
+-- (user_id, session_id, last_activity DESC) covers both the per-user and
+-- per-session lookups, including their last_activity ordering, and replaces
+-- the narrower (user_id, is_active) partial index
+
+CREATE INDEX IF NOT EXISTS idx_app_sessions_active_recent
+ON app_sessions(user_id, session_id, last_activity DESC)
+WHERE is_active = TRUE;
+
+DROP INDEX IF EXISTS idx_app_sessions_active;
@@ -0,0 +1,41 @@
+-- Migration 028: Return only the top apps from get_app_usage_summary
+-- Day totals are computed over every app with window functions before
+-- LIMIT applies, so callers still get the full totals
+-- A NULL limit returns every app
+
+DROP FUNCTION IF EXISTS get_app_usage_summary(UUID, DATE);
+
+CREATE OR REPLACE FUNCTION get_app_usage_summary(
+    p_user_id UUID,
+    p_date DATE,
+    p_limit INTEGER DEFAULT NULL
+)
+RETURNS TABLE(
+    app_name TEXT,
+    total_minutes BIGINT,
+    day_total_apps BIGINT,
+    day_total_minutes BIGINT
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        apps.app_name,
+        apps.total_minutes,
+        COUNT(*) OVER () AS day_total_apps,
+        (SUM(apps.total_minutes) OVER ())::BIGINT AS day_total_minutes
+    FROM (
+        SELECT
+            s.app_name,
+            SUM(GREATEST(1, COALESCE(s.duration_seconds, 0) / 60))::BIGINT AS total_minutes
+        FROM app_sessions s
+        WHERE s.user_id = p_user_id
+          AND s.start_time >= p_date
+          AND s.start_time < p_date + 1
+        GROUP BY s.app_name
+    ) apps
+    ORDER BY apps.total_minutes DESC
+    LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION get_app_usage_summary IS 'Top apps by minutes on a given day with totals across all apps, each session counting at least one minute';
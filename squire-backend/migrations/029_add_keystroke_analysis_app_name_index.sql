@@ -0,0 +1,10 @@
+-- Migration 029: Index keystroke analyses by the app they were recorded in
+-- Backs get_efficiency_insights' per-app filter, which reads the app name
+-- from analysis_data and orders the user's analyses by created_at
+
+CREATE INDEX IF NOT EXISTS idx_keystroke_analysis_user_app
+ON keystroke_analysis(
+    user_id,
+    (analysis_data->'efficiency_analysis'->'analysis_context'->>'app_name'),
+    created_at DESC
+);
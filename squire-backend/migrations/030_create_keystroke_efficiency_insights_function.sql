@@ -0,0 +1,53 @@
+-- Migration 030: Aggregate keystroke efficiency insights in the database
+-- Used by KeystrokeAnalysisService.get_efficiency_insights instead of
+-- fetching the latest analyses and averaging them in Python
+-- A NULL app name covers every app
+
+CREATE OR REPLACE FUNCTION get_keystroke_efficiency_insights(
+    p_user_id UUID,
+    p_app_name TEXT DEFAULT NULL,
+    p_limit INTEGER DEFAULT 20,
+    p_recent_limit INTEGER DEFAULT 5
+)
+RETURNS TABLE(
+    total_analyses BIGINT,
+    average_efficiency_score DOUBLE PRECISION,
+    common_improvement_areas JSONB,
+    recent_insights JSONB
+) AS $$
+BEGIN
+    RETURN QUERY
+    WITH recent AS (
+        SELECT a.analysis_data, a.created_at
+        FROM keystroke_analysis a
+        WHERE a.user_id = p_user_id
+          AND (p_app_name IS NULL
+               OR a.analysis_data->'efficiency_analysis'->'analysis_context'->>'app_name' = p_app_name)
+        ORDER BY a.created_at DESC
+        LIMIT p_limit
+    )
+    SELECT
+        (SELECT COUNT(*) FROM recent),
+        (SELECT AVG(COALESCE((r.analysis_data->>'efficiency_score')::DOUBLE PRECISION, 0.5)) FROM recent r),
+        (
+            SELECT COALESCE(jsonb_object_agg(areas.rec_type, areas.rec_count), '{}'::JSONB)
+            FROM (
+                SELECT COALESCE(rec->>'type', 'unknown') AS rec_type, COUNT(*) AS rec_count
+                FROM recent r,
+                     jsonb_array_elements(COALESCE(r.analysis_data->'recommendations', '[]'::JSONB)) rec
+                GROUP BY 1
+            ) areas
+        ),
+        (
+            SELECT COALESCE(jsonb_agg(latest.analysis_data ORDER BY latest.created_at DESC), '[]'::JSONB)
+            FROM (
+                SELECT r.analysis_data, r.created_at
+                FROM recent r
+                ORDER BY r.created_at DESC
+                LIMIT p_recent_limit
+            ) latest
+        );
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION get_keystroke_efficiency_insights IS 'Average efficiency, recommendation counts and latest analyses over a user''s most recent keystroke analyses';
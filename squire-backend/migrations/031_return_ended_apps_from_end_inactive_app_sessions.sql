@@ -0,0 +1,31 @@
+-- Migration 031: Return the ended apps from end_inactive_app_sessions
+-- AppSessionService only drops its cached state for the apps that were
+-- actually ended, so it needs their names rather than a count
+
+DROP FUNCTION IF EXISTS end_inactive_app_sessions(UUID, UUID, INTEGER, TEXT);
+
+CREATE OR REPLACE FUNCTION end_inactive_app_sessions(
+    p_user_id UUID,
+    p_session_id UUID,
+    p_timeout_minutes INTEGER DEFAULT 5,
+    p_reason TEXT DEFAULT 'timeout'
+)
+RETURNS TABLE(app_name TEXT) AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE app_sessions s
+    SET
+        end_time = NOW(),
+        is_active = FALSE,
+        transition_reason = p_reason,
+        updated_at = NOW()
+    WHERE
+        s.user_id = p_user_id
+        AND s.session_id = p_session_id
+        AND s.is_active = TRUE
+        AND s.last_activity < NOW() - make_interval(mins => p_timeout_minutes)
+    RETURNING s.app_name;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION end_inactive_app_sessions IS 'Ends active app sessions idle longer than the timeout and returns the names of the apps ended';
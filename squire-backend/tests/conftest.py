@@ -0,0 +1,18 @@
+"""
+Shared setup for the unit tests
+
+Settings are read at import time, so placeholder values are set before any
+app module is imported. Nothing here talks to Supabase or Google; tests
+replace the database entry points with fakes.
+"""
+import os
+import sys
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
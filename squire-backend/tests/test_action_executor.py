@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+from app.agents.base_agent import ActionResult
+from app.services.action_executor import ActionExecutor
+
+
+class FakeAgent:
+    def __init__(self, user_id, credentials):
+        self.user_id = user_id
+        self.credentials = credentials
+
+
+def _executor(expires_in=3600):
+    executor = ActionExecutor()
+    executor.agent_registry = {"gmail_send": FakeAgent, "calendar_create_event": FakeAgent}
+    executor.loads = 0
+    executor.token = "token-1"
+
+    async def load(user_id, service_name, provider):
+        executor.loads += 1
+        await asyncio.sleep(0)
+        return {"access_token": executor.token}, expires_in
+
+    executor._load_user_credentials = load
+    return executor
+
+
+def test_concurrent_misses_share_one_credential_load():
+    async def scenario():
+        executor = _executor()
+        results = await asyncio.gather(*[
+            executor._get_user_credentials("user", "gmail") for _ in range(5)
+        ])
+        return executor, results
+
+    executor, results = asyncio.run(scenario())
+
+    assert executor.loads == 1
+    assert all(result == {"access_token": "token-1"} for result in results)
+    assert len(executor._cred_locks) == 0
+
+
+def test_credential_cache_drops_least_recently_used():
+    async def scenario():
+        executor = _executor()
+        executor.CREDENTIAL_CACHE_MAX_SIZE = 2
+        for user in ("a", "b"):
+            await executor._get_user_credentials(user, "gmail")
+        # Touch "a" so "b" is the least recently used when "c" arrives
+        await executor._get_user_credentials("a", "gmail")
+        await executor._get_user_credentials("c", "gmail")
+        return list(executor._cred_cache)
+
+    assert asyncio.run(scenario()) == [("a", "google"), ("c", "google")]
+
+
+def test_agent_is_reused_until_its_token_changes():
+    async def scenario():
+        executor = _executor()
+        async with executor._checkout_agent("gmail_send", "user") as first:
+            pass
+        async with executor._checkout_agent("gmail_send", "user") as second:
+            pass
+
+        executor._invalidate_credentials("user")
+        executor.token = "token-2"
+        async with executor._checkout_agent("gmail_send", "user") as third:
+            pass
+        return executor, first, second, third
+
+    executor, first, second, third = asyncio.run(scenario())
+
+    assert first is second
+    assert third is not first
+    assert third.credentials["access_token"] == "token-2"
+    assert len(executor._service_locks) == 0
+
+
+def test_agent_expires_with_its_credentials():
+    async def scenario():
+        executor = _executor(expires_in=3600)
+        first = await executor._get_agent("gmail_send", "user")
+
+        # Age both caches past the token's expiry margin
+        key = ("user", "google")
+        token_data, _ = executor._cred_cache[key]
+        executor._cred_cache[key] = (token_data, time.monotonic())
+        agent, token, _ = executor._agent_cache[("user", "gmail")]
+        executor._agent_cache[("user", "gmail")] = (agent, token, time.monotonic())
+
+        second = await executor._get_agent("gmail_send", "user")
+        return executor, first, second
+
+    executor, first, second = asyncio.run(scenario())
+
+    assert second is not first
+    assert executor.loads == 2
+
+
+def test_agent_cache_drops_least_recently_used():
+    async def scenario():
+        executor = _executor()
+        executor.AGENT_CACHE_MAX_SIZE = 2
+        for user in ("a", "b", "c"):
+            await executor._get_agent("gmail_send", user)
+        return list(executor._agent_cache)
+
+    assert asyncio.run(scenario()) == [("b", "gmail"), ("c", "gmail")]
+
+
+def test_step_cap_is_per_request():
+    async def scenario():
+        executor = _executor()
+        executor.MAX_CONCURRENT_STEPS = 1
+        release = asyncio.Event()
+
+        async def queue(user_id, action_type, action_params, **kwargs):
+            return {"id": action_params["id"]}
+
+        async def execute(action_id, user_id, action_data=None):
+            if action_id.startswith("slow"):
+                await release.wait()
+            return ActionResult(success=True, data={"id": action_id})
+
+        executor._queue_action_step = queue
+        executor._execute_action = execute
+        # An action type without tool metadata skips parameter validation
+        step = "noop_action"
+
+        slow = asyncio.create_task(executor.execute_direct_actions(
+            "a", [{"action_type": step, "action_params": {"id": f"slow-{i}"}} for i in range(2)]
+        ))
+        await asyncio.sleep(0)
+        # A second request completes while the first is still holding its only slot
+        fast = await asyncio.wait_for(executor.execute_direct_actions(
+            "b", [{"action_type": step, "action_params": {"id": "fast"}}]
+        ), timeout=1)
+        assert not slow.done()
+
+        release.set()
+        return fast, await slow
+
+    fast, slow = asyncio.run(scenario())
+
+    assert [result.data["id"] for result in fast] == ["fast"]
+    assert [result.data["id"] for result in slow] == ["slow-0", "slow-1"]
@@ -0,0 +1,130 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import pytest
+
+import app.services.app_session_service as app_session_module
+from app.services.app_session_service import AppSessionService
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    # The cache lives on the class, so each test gets its own copy
+    monkeypatch.setattr(AppSessionService, "_active_sessions", OrderedDict())
+    monkeypatch.setattr(AppSessionService, "_session_apps", {})
+    monkeypatch.setattr(AppSessionService, "_session_keys", {})
+    monkeypatch.setattr(AppSessionService, "_pending_heartbeats", {})
+    monkeypatch.setattr(AppSessionService, "_flush_task", None)
+
+
+@pytest.fixture
+def rpc(monkeypatch):
+    calls = []
+    responses = {}
+
+    async def execute_rpc(name, params):
+        calls.append((name, params))
+        response = responses.get(name)
+        if isinstance(response, Exception):
+            raise response
+        return response(params) if callable(response) else response
+
+    monkeypatch.setattr(app_session_module, "execute_rpc", execute_rpc)
+    return calls, responses
+
+
+def _assert_indexes_match_cache():
+    active = AppSessionService._active_sessions
+    assert AppSessionService._session_keys == {entry[0]: key for key, entry in active.items()}
+    session_apps = {}
+    for user_id, session_id, app_name in active:
+        session_apps.setdefault((user_id, session_id), set()).add(app_name)
+    assert AppSessionService._session_apps == session_apps
+
+
+def test_sessions_not_written_for_ttl_are_evicted():
+    ttl = AppSessionService.ACTIVE_SESSION_TTL
+    AppSessionService._set_active_session(("u1", "s1", "Mail"), "id-1", 0)
+    AppSessionService._set_active_session(("u2", "s2", "Slack"), "id-2", 100)
+    AppSessionService._set_active_session(("u1", "s1", "Mail"), "id-1", 200)
+
+    # Only u2's entry is older than the TTL once this write lands
+    AppSessionService._set_active_session(("u3", "s3", "Code"), "id-3", 100 + ttl + 1)
+
+    assert list(AppSessionService._active_sessions) == [("u1", "s1", "Mail"), ("u3", "s3", "Code")]
+    _assert_indexes_match_cache()
+
+
+def test_new_session_id_replaces_the_old_index_entry():
+    now = time.monotonic()
+    AppSessionService._set_active_session(("u1", "s1", "Mail"), "id-1", now)
+    AppSessionService._set_active_session(("u1", "s1", "Mail"), "id-2", now + 1)
+
+    assert "id-1" not in AppSessionService._session_keys
+    _assert_indexes_match_cache()
+
+
+def test_opening_an_app_forgets_the_sessions_other_apps():
+    now = time.monotonic()
+    AppSessionService._set_active_session(("u1", "s1", "Mail"), "id-1", now)
+    AppSessionService._set_active_session(("u1", "s2", "Mail"), "id-2", now)
+    AppSessionService._pending_heartbeats[("u1", "s1", "Mail")] = {}
+
+    AppSessionService._remember_active_session(("u1", "s1", "Slack"), "id-3")
+
+    assert set(AppSessionService._active_sessions) == {("u1", "s2", "Mail"), ("u1", "s1", "Slack")}
+    assert AppSessionService._pending_heartbeats == {}
+    _assert_indexes_match_cache()
+
+
+def test_failed_heartbeat_flush_drops_the_cached_sessions(rpc):
+    calls, responses = rpc
+    now = time.monotonic()
+    responses["upsert_app_sessions"] = RuntimeError("database unavailable")
+    key = ("u1", "s1", "Mail")
+    AppSessionService._set_active_session(key, "id-1", now)
+    AppSessionService._pending_heartbeats[key] = {"app_name": "Mail"}
+
+    asyncio.run(AppSessionService.flush_heartbeats())
+
+    assert [name for name, _ in calls] == ["upsert_app_sessions"]
+    assert AppSessionService._pending_heartbeats == {}
+    assert AppSessionService._active_sessions == OrderedDict()
+    _assert_indexes_match_cache()
+
+
+def test_end_inactive_sessions_forgets_only_ended_apps(rpc):
+    calls, responses = rpc
+    now = time.monotonic()
+    responses["upsert_app_sessions"] = lambda params: [
+        {"app_session_id": f"id-{session['app_name']}"} for session in params["p_sessions"]
+    ]
+    responses["end_inactive_app_sessions"] = [{"app_name": "Mail"}]
+    for app_name in ("Mail", "Slack"):
+        AppSessionService._set_active_session(("u1", "s1", app_name), f"id-{app_name}", now)
+    AppSessionService._set_active_session(("u2", "s1", "Mail"), "id-other", now)
+    AppSessionService._pending_heartbeats[("u1", "s1", "Slack")] = {"app_name": "Slack"}
+    AppSessionService._pending_heartbeats[("u2", "s1", "Mail")] = {"app_name": "Mail"}
+
+    ended = asyncio.run(AppSessionService.end_inactive_sessions("u1", "s1"))
+
+    assert ended == 1
+    # Only this session's buffered heartbeat is flushed before the timeout check
+    assert calls[0] == ("upsert_app_sessions", {"p_sessions": [{"app_name": "Slack"}]})
+    assert set(AppSessionService._active_sessions) == {("u1", "s1", "Slack"), ("u2", "s1", "Mail")}
+    assert list(AppSessionService._pending_heartbeats) == [("u2", "s1", "Mail")]
+    _assert_indexes_match_cache()
+
+
+def test_end_app_session_forgets_it_by_id(rpc):
+    now = time.monotonic()
+    AppSessionService._set_active_session(("u1", "s1", "Mail"), "id-1", now)
+    AppSessionService._set_active_session(("u1", "s1", "Slack"), "id-2", now)
+    AppSessionService._pending_heartbeats[("u1", "s1", "Mail")] = {}
+
+    assert asyncio.run(AppSessionService.end_app_session("id-1"))
+
+    assert list(AppSessionService._active_sessions) == [("u1", "s1", "Slack")]
+    assert AppSessionService._pending_heartbeats == {}
+    _assert_indexes_match_cache()
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+import app.services.auth_service as auth_module
+from app.services.auth_service import AuthService
+
+
+class FakeUpsert:
+    def __init__(self, client, rows):
+        self.client = client
+        self.rows = rows
+
+    async def execute(self):
+        await asyncio.sleep(0)
+        if self.client.failures:
+            self.client.failures -= 1
+            raise RuntimeError("upsert failed")
+        self.client.written.append({(row["user_id"], row["provider"]): row["access_token"] for row in self.rows})
+
+
+class FakeClient:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.written = []
+
+    def table(self, name):
+        return self
+
+    def upsert(self, rows, **kwargs):
+        return FakeUpsert(self, rows)
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    monkeypatch.setattr(auth_module, "encrypt_token", lambda token: token)
+
+    def install(failures=0):
+        client = FakeClient(failures)
+
+        async def get_client():
+            return client
+
+        monkeypatch.setattr(auth_module, "get_async_supabase", get_client)
+        return client
+
+    return install
+
+
+def _service():
+    service = AuthService()
+    service.OAUTH_TOKEN_FLUSH_DELAY = 0.01
+    service.OAUTH_TOKEN_RETRY_DELAY = 0.01
+    return service
+
+
+def test_failed_upsert_is_retried_and_newer_tokens_win(fake_client):
+    client = fake_client(failures=1)
+
+    async def scenario():
+        service = _service()
+        await service._store_oauth_tokens("u1", "google", "old")
+        await service._store_oauth_tokens("u2", "google", "other")
+        await service.flush_oauth_tokens()
+
+        # A token buffered after the failed attempt replaces the requeued one
+        await service._store_oauth_tokens("u1", "google", "new")
+        await asyncio.sleep(0.1)
+        return service
+
+    service = asyncio.run(scenario())
+
+    assert client.written == [{("u1", "google"): "new", ("u2", "google"): "other"}]
+    assert service._pending_oauth_tokens == {}
+    assert service._failed_oauth_flushes == 0
+
+
+def test_tokens_are_dropped_after_max_attempts(fake_client):
+    client = fake_client(failures=AuthService.OAUTH_TOKEN_MAX_ATTEMPTS)
+
+    async def scenario():
+        service = _service()
+        await service._store_oauth_tokens("u1", "google", "token")
+        await asyncio.sleep(0.2)
+        return service
+
+    service = asyncio.run(scenario())
+
+    assert client.written == []
+    assert service._pending_oauth_tokens == {}
+    assert service._failed_oauth_flushes == 0
+    assert service._oauth_retry_at == 0.0
+
+
+def test_claims_cache_drops_least_recently_used():
+    async def scenario():
+        service = AuthService()
+        service.CLAIMS_CACHE_MAX_SIZE = 2
+        decoded = []
+
+        async def decode(token):
+            decoded.append(token)
+            return {"sub": token}
+
+        service._decode_token = decode
+        for token in ("a", "b", "a", "c", "a", "b"):
+            await service.verify_token(token)
+        return decoded
+
+    # "a" stays cached because it is used again before each eviction
+    assert asyncio.run(scenario()) == ["a", "b", "c", "b"]
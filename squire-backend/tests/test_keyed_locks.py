@@ -0,0 +1,34 @@
+import asyncio
+
+from app.core.locks import KeyedLocks
+
+
+def test_lock_is_dropped_once_unused():
+    async def scenario():
+        locks = KeyedLocks()
+        async with locks.hold("a"):
+            assert len(locks) == 1
+        assert len(locks) == 0
+
+    asyncio.run(scenario())
+
+
+def test_waiters_share_one_lock_and_run_in_turn():
+    async def scenario():
+        locks = KeyedLocks()
+        running = 0
+        peak = 0
+
+        async def worker():
+            nonlocal running, peak
+            async with locks.hold("a"):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*[worker() for _ in range(5)])
+        assert peak == 1
+        assert len(locks) == 0
+
+    asyncio.run(scenario())
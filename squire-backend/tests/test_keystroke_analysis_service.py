@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+import app.services.keystroke_analysis_service as keystroke_module
+from app.services.keystroke_analysis_service import KeystrokeAnalysisService
+
+
+class FakeTable:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.rows = None
+
+    def upsert(self, rows, **kwargs):
+        self.rows = rows
+        return self
+
+    async def execute(self):
+        await asyncio.sleep(0)
+        if self.client.failures.get(self.name, 0):
+            self.client.failures[self.name] -= 1
+            raise RuntimeError(f"{self.name} insert failed")
+        self.client.written.append((self.name, [row["id"] for row in self.rows]))
+
+
+class FakeClient:
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.written = []
+
+    def table(self, name):
+        return FakeTable(self, name)
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    def install(failures=None):
+        client = FakeClient(failures)
+
+        async def get_client():
+            return client
+
+        monkeypatch.setattr(keystroke_module, "get_async_supabase", get_client)
+        return client
+
+    return install
+
+
+def _service():
+    service = KeystrokeAnalysisService()
+    service.INSERT_FLUSH_DELAY = 0.01
+    service.INSERT_RETRY_DELAY = 0.01
+    return service
+
+
+def test_failed_analyses_are_retried_after_their_sequences(fake_client):
+    client = fake_client({"keystroke_analysis": 1})
+
+    async def scenario():
+        service = _service()
+        result = await service.process_keystroke_sequence("user", {"keystroke_count": 3}, {})
+        await asyncio.sleep(0.1)
+        return service, result
+
+    service, result = asyncio.run(scenario())
+
+    # Sequences are written once; the analysis is retried alone and lands after them
+    assert [name for name, _ in client.written] == ["keystroke_sequences", "keystroke_analysis"]
+    assert client.written[0][1] == [result["sequence_id"]]
+    assert not service._pending_sequences and not service._pending_analyses
+
+
+def test_batch_is_dropped_after_max_attempts(fake_client):
+    client = fake_client({"keystroke_sequences": KeystrokeAnalysisService.INSERT_MAX_ATTEMPTS})
+
+    async def scenario():
+        service = _service()
+        await service.process_keystroke_sequence("user", {"keystroke_count": 3}, {})
+        await asyncio.sleep(0.2)
+        return service
+
+    service = asyncio.run(scenario())
+
+    assert client.written == []
+    assert not service._pending_sequences and not service._pending_analyses
+    assert service._failed_flushes == 0
+
+
+def test_flushes_do_not_overlap(fake_client):
+    client = fake_client()
+
+    async def scenario():
+        service = _service()
+        service._pending_sequences = [{"id": "s1", "user_id": "user"}]
+        await asyncio.gather(service.flush_inserts(), service.flush_inserts())
+
+    asyncio.run(scenario())
+    assert client.written == [("keystroke_sequences", ["s1"])]
+
+
+def test_cached_read_loads_cold_key_once_and_returns_copies():
+    async def scenario():
+        service = KeystrokeAnalysisService()
+        loads = 0
+
+        async def load():
+            nonlocal loads
+            loads += 1
+            await asyncio.sleep(0.01)
+            return {"items": [1]}
+
+        async def late_caller():
+            await asyncio.sleep(0.005)
+            return await service._cached_read(("patterns", "user", 10), load)
+
+        results = await asyncio.gather(
+            *[service._cached_read(("patterns", "user", 10), load) for _ in range(5)],
+            late_caller()
+        )
+        results[1]["items"].append(2)
+        again = await service._cached_read(("patterns", "user", 10), load)
+        return loads, results, again, service
+
+    loads, results, again, service = asyncio.run(scenario())
+
+    assert loads == 1
+    assert all(result == {"items": [1]} for result in results[2:])
+    assert again == {"items": [1]}
+    assert service._read_locks == {}
+
+
+def test_read_cache_is_bounded_and_invalidated_per_user():
+    async def scenario():
+        service = KeystrokeAnalysisService()
+        service.READ_CACHE_MAX_SIZE = 2
+
+        async def load():
+            return []
+
+        for user in ("a", "b", "c"):
+            await service._cached_read(("patterns", user, 10), load)
+        evicted = list(service._read_cache)
+
+        service._invalidate_reads({"c"})
+        return evicted, list(service._read_cache)
+
+    evicted, remaining = asyncio.run(scenario())
+
+    assert evicted == [("patterns", "b", 10), ("patterns", "c", 10)]
+    assert remaining == [("patterns", "b", 10)]